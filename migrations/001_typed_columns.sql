@@ -0,0 +1,37 @@
+-- Числовые колонки для фильтров по цене, площади и комнатам.
+-- Заполняются парсером при сохранении; здесь — дозаполнение старых строк и индексы.
+
+ALTER TABLE rental
+    ADD COLUMN IF NOT EXISTS price_rub BIGINT,
+    ADD COLUMN IF NOT EXISTS area_m2 NUMERIC(8, 2),
+    ADD COLUMN IF NOT EXISTS rooms_n SMALLINT;
+
+ALTER TABLE sale
+    ADD COLUMN IF NOT EXISTS price_rub BIGINT,
+    ADD COLUMN IF NOT EXISTS area_m2 NUMERIC(8, 2),
+    ADD COLUMN IF NOT EXISTS rooms_n SMALLINT;
+
+-- Дозаполнение существующих строк (та же логика, что в parser/normalize.py)
+UPDATE rental SET
+    price_rub = NULLIF(REGEXP_REPLACE(price, '[^0-9]', '', 'g'), '')::BIGINT,
+    area_m2 = REPLACE(SUBSTRING(area FROM '[0-9]+(?:[.,][0-9]+)?'), ',', '.')::NUMERIC,
+    rooms_n = CASE
+        WHEN rooms ILIKE '%студия%' THEN 0
+        ELSE SUBSTRING(rooms FROM '^\s*([0-9]+)\s*-\s*к')::SMALLINT
+    END
+WHERE price_rub IS NULL AND area_m2 IS NULL AND rooms_n IS NULL;
+
+UPDATE sale SET
+    price_rub = NULLIF(REGEXP_REPLACE(price, '[^0-9]', '', 'g'), '')::BIGINT,
+    area_m2 = REPLACE(SUBSTRING(area FROM '[0-9]+(?:[.,][0-9]+)?'), ',', '.')::NUMERIC,
+    rooms_n = CASE
+        WHEN rooms ILIKE '%студия%' THEN 0
+        ELSE SUBSTRING(rooms FROM '^\s*([0-9]+)\s*-\s*к')::SMALLINT
+    END
+WHERE price_rub IS NULL AND area_m2 IS NULL AND rooms_n IS NULL;
+
+CREATE INDEX IF NOT EXISTS rental_rooms_area_price_idx ON rental (rooms_n, area_m2, price_rub);
+CREATE INDEX IF NOT EXISTS sale_rooms_area_price_idx ON sale (rooms_n, area_m2, price_rub);
+
+ANALYZE rental;
+ANALYZE sale;
@@ -0,0 +1,45 @@
+-- id объявления Avito (из ссылки) как ключ дедупликации вместо адреса.
+
+ALTER TABLE rental
+    ADD COLUMN IF NOT EXISTS link VARCHAR(512),
+    ADD COLUMN IF NOT EXISTS avito_id BIGINT;
+
+ALTER TABLE sale
+    ADD COLUMN IF NOT EXISTS link VARCHAR(512),
+    ADD COLUMN IF NOT EXISTS avito_id BIGINT;
+
+-- Дозаполнение по ссылке (та же логика, что parse_item_id в parser/normalize.py)
+UPDATE rental SET avito_id = SUBSTRING(link FROM '_([0-9]+)/?(?:[?#]|$)')::BIGINT
+WHERE avito_id IS NULL AND link IS NOT NULL;
+
+UPDATE sale SET avito_id = SUBSTRING(link FROM '_([0-9]+)/?(?:[?#]|$)')::BIGINT
+WHERE avito_id IS NULL AND link IS NOT NULL;
+
+-- Дубликаты по id (одно объявление под разными адресами) — оставляем самую раннюю строку
+DELETE FROM rental r USING rental d
+WHERE r.avito_id = d.avito_id AND r.id > d.id;
+
+DELETE FROM sale s USING sale d
+WHERE s.avito_id = d.avito_id AND s.id > d.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS rental_avito_id_key ON rental (avito_id);
+CREATE UNIQUE INDEX IF NOT EXISTS sale_avito_id_key ON sale (avito_id);
+
+-- Уникальность по адресу больше не нужна: разные квартиры в одном доме
+-- перестают отбрасываться как дубликаты
+DO $$
+DECLARE
+    c RECORD;
+BEGIN
+    FOR c IN
+        SELECT con.conrelid::regclass AS tbl, con.conname
+        FROM pg_constraint con
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = ANY (con.conkey)
+        WHERE con.contype = 'u'
+          AND con.conrelid IN ('rental'::regclass, 'sale'::regclass)
+          AND a.attname = 'address'
+          AND array_length(con.conkey, 1) = 1
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', c.tbl, c.conname);
+    END LOOP;
+END $$;
@@ -0,0 +1,41 @@
+-- Отслеживание изменений объявлений и история цен.
+
+ALTER TABLE rental
+    ADD COLUMN IF NOT EXISTS content_hash BIGINT,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+ALTER TABLE sale
+    ADD COLUMN IF NOT EXISTS content_hash BIGINT,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- Строка пишется только когда у объявления меняется хэш содержимого
+CREATE TABLE IF NOT EXISTS listing_history (
+    id BIGSERIAL PRIMARY KEY,
+    deal VARCHAR(4) NOT NULL CHECK (deal IN ('rent', 'sale')),
+    avito_id BIGINT NOT NULL,
+    content_hash BIGINT,
+    price VARCHAR(50),
+    price_rub BIGINT,
+    area_m2 NUMERIC(8, 2),
+    rooms_n SMALLINT,
+    address VARCHAR(255),
+    property_type VARCHAR(20),
+    observed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS listing_history_item_idx ON listing_history (deal, avito_id, observed_at);
+
+-- Текущее состояние уже сохранённых объявлений — первая точка истории.
+-- content_hash у старых строк пуст: при следующем обходе они обновятся
+-- и получат хэш, посчитанный парсером.
+INSERT INTO listing_history (deal, avito_id, price, price_rub, area_m2, rooms_n, address, observed_at)
+SELECT 'rent', avito_id, price, price_rub, area_m2, rooms_n, address, created_at
+FROM rental
+WHERE avito_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM listing_history h WHERE h.deal = 'rent' AND h.avito_id = rental.avito_id);
+
+INSERT INTO listing_history (deal, avito_id, price, price_rub, area_m2, rooms_n, address, property_type, observed_at)
+SELECT 'sale', avito_id, price, price_rub, area_m2, rooms_n, address, property_type, created_at
+FROM sale
+WHERE avito_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM listing_history h WHERE h.deal = 'sale' AND h.avito_id = sale.avito_id);
@@ -0,0 +1,18 @@
+-- Очередь исходящих сообщений Telegram (TELEGRAM_OUTBOX_PERSIST=1).
+
+CREATE TABLE IF NOT EXISTS telegram_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    method VARCHAR(32) NOT NULL DEFAULT 'sendMessage',
+    payload JSONB NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Выборка ожидающих сообщений не должна сканировать отправленные
+CREATE INDEX IF NOT EXISTS telegram_outbox_pending_idx ON telegram_outbox (id)
+    WHERE status IN ('pending', 'sending');
@@ -0,0 +1,15 @@
+-- Сохранённые фильтры пользователей для уведомлений о новых объявлениях.
+-- NULL в фильтре означает "любое значение". Одна подписка на сделку на чат.
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id SERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    deal VARCHAR(4) NOT NULL CHECK (deal IN ('rent', 'sale')),
+    rooms_n SMALLINT,
+    min_area NUMERIC(8, 2),
+    max_price BIGINT,
+    property_type VARCHAR(20) CHECK (property_type IN ('вторичка', 'новостройка')),
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (chat_id, deal)
+);
@@ -0,0 +1,10 @@
+-- Поколения данных для кэша результатов поиска веб-приложения.
+-- Парсер увеличивает поколение таблицы после каждого батча с изменениями.
+
+CREATE TABLE IF NOT EXISTS cache_generation (
+    table_name VARCHAR(32) PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO cache_generation (table_name) VALUES ('rental'), ('sale')
+ON CONFLICT (table_name) DO NOTHING;
@@ -0,0 +1,11 @@
+-- Индексы под сортировки выдачи с keyset-пагинацией:
+-- сначала дешевле (price_rub, id) и по цене за м². Комнаты — ведущая колонка,
+-- так как фильтр по ним есть почти в каждом запросе.
+
+CREATE INDEX IF NOT EXISTS rental_rooms_price_id_idx ON rental (rooms_n, price_rub, id);
+CREATE INDEX IF NOT EXISTS sale_rooms_price_id_idx ON sale (rooms_n, price_rub, id);
+
+CREATE INDEX IF NOT EXISTS rental_rooms_ppm2_id_idx
+    ON rental (rooms_n, (ROUND(price_rub::numeric / NULLIF(area_m2, 0), 2)), id);
+CREATE INDEX IF NOT EXISTS sale_rooms_ppm2_id_idx
+    ON sale (rooms_n, (ROUND(price_rub::numeric / NULLIF(area_m2, 0), 2)), id);
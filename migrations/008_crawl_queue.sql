@@ -0,0 +1,35 @@
+-- Город объявления (источники из parser/sources.yaml) и общая очередь
+-- страниц обхода для нескольких процессов парсера.
+
+ALTER TABLE rental ADD COLUMN IF NOT EXISTS city VARCHAR(64);
+ALTER TABLE sale ADD COLUMN IF NOT EXISTS city VARCHAR(64);
+
+-- До реестра источников обходился только Петербург
+UPDATE rental SET city = 'Санкт-Петербург' WHERE city IS NULL;
+UPDATE sale SET city = 'Санкт-Петербург' WHERE city IS NULL;
+
+CREATE TABLE IF NOT EXISTS crawl_queue (
+    id BIGSERIAL PRIMARY KEY,
+    source VARCHAR(64) NOT NULL,
+    page INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    not_before TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(128),
+    locked_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    listed INTEGER,
+    items INTEGER,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Одна незавершённая задача на страницу источника: повторная постановка
+-- в очередь до окончания обхода ничего не добавляет
+CREATE UNIQUE INDEX IF NOT EXISTS crawl_queue_active_idx ON crawl_queue (source, page)
+    WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS crawl_queue_pending_idx ON crawl_queue (not_before, id)
+    WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS crawl_queue_finished_idx ON crawl_queue (source, finished_at)
+    WHERE status = 'done';
@@ -0,0 +1,35 @@
+-- Разобранный адрес объявления: улица и дом в каноническом написании,
+-- район и станция метро из справочника geo_places (parser/address.py).
+-- Фильтр по месту — равенство по id с индексом вместо ILIKE '%...%' по адресу.
+
+CREATE TABLE IF NOT EXISTS geo_places (
+    id SERIAL PRIMARY KEY,
+    city VARCHAR(64) NOT NULL,
+    kind VARCHAR(8) NOT NULL CHECK (kind IN ('district', 'metro')),
+    name VARCHAR(128) NOT NULL,
+    UNIQUE (city, kind, name)
+);
+
+-- Поиск места по вводу пользователя в боте: без учёта регистра и ё/е
+-- (ключ строит place_key в bot/search.py)
+CREATE INDEX IF NOT EXISTS geo_places_key_idx ON geo_places ((lower(replace(name, 'ё', 'е'))));
+
+ALTER TABLE rental
+    ADD COLUMN IF NOT EXISTS street VARCHAR(128),
+    ADD COLUMN IF NOT EXISTS house VARCHAR(32),
+    ADD COLUMN IF NOT EXISTS district_id INTEGER REFERENCES geo_places (id),
+    ADD COLUMN IF NOT EXISTS metro_id INTEGER REFERENCES geo_places (id);
+ALTER TABLE sale
+    ADD COLUMN IF NOT EXISTS street VARCHAR(128),
+    ADD COLUMN IF NOT EXISTS house VARCHAR(32),
+    ADD COLUMN IF NOT EXISTS district_id INTEGER REFERENCES geo_places (id),
+    ADD COLUMN IF NOT EXISTS metro_id INTEGER REFERENCES geo_places (id);
+
+-- id — ключ сортировки «сначала новые» и курсор пагинации
+CREATE INDEX IF NOT EXISTS rental_district_id_idx ON rental (district_id, id) WHERE district_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS rental_metro_id_idx ON rental (metro_id, id) WHERE metro_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS sale_district_id_idx ON sale (district_id, id) WHERE district_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS sale_metro_id_idx ON sale (metro_id, id) WHERE metro_id IS NOT NULL;
+
+-- Уже сохранённые строки заполняются командой
+--   python parser.py --backfill-address
@@ -0,0 +1,20 @@
+-- Статистика рынка: процентили цены и цены за м² по группам
+-- сделка × город × комнаты × район (district_id = 0 — весь город).
+-- Группы пересчитывает парсер после батчей с изменениями
+-- (parser/market_stats.py); веб-приложение и бот читают строку по ключу.
+
+CREATE TABLE IF NOT EXISTS market_stats (
+    deal VARCHAR(4) NOT NULL CHECK (deal IN ('rent', 'sale')),
+    city VARCHAR(64) NOT NULL,
+    rooms_n SMALLINT NOT NULL,
+    district_id INTEGER NOT NULL DEFAULT 0,
+    listings INTEGER NOT NULL DEFAULT 0,
+    -- Значения для процентилей 0..100: элемент [n + 1] — n-й процентиль
+    price_percentiles BIGINT[],
+    ppm2_percentiles NUMERIC[],
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (deal, city, rooms_n, district_id)
+);
+
+-- Первое заполнение по уже сохранённым объявлениям:
+--   python parser.py --refresh-stats
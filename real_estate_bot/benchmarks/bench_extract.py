@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Сравнение бэкендов разбора HTML по времени на страницу и пиковой памяти.
+#
+#   python bench_extract.py [--pages DIR] [--repeat N]
+#
+# Каждый бэкенд запускается в отдельном процессе, чтобы пиковый RSS
+# одного не влиял на замер другого.
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from pages import load_pages
+
+
+def run_backend(name, directory, repeat):
+    from extract import BACKENDS
+
+    backend = BACKENDS[name]()
+    pages = load_pages(directory)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        for _, html in pages:
+            started = time.perf_counter()
+            items += len(backend.extract(html))
+            timings.append(time.perf_counter() - started)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    for _, html in pages:
+        backend.extract(html)
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "backend": name,
+        "pages": len(timings),
+        "items": items,
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": sorted(timings)[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0] * 1000,
+        "py_peak_kb": py_peak / 1024,
+        "rss_growth_kb": rss_after - rss_before,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--pages", help="каталог с сохранёнными страницами выдачи")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, args.pages, args.repeat)))
+        return
+
+    from extract import BACKENDS
+
+    print(f"{'бэкенд':<12}{'страниц':>9}{'медиана, мс':>14}{'p95, мс':>10}{'py peak, КБ':>14}{'RSS +, КБ':>12}")
+    for name in BACKENDS:
+        cmd = [sys.executable, __file__, "--child", name, "--repeat", str(args.repeat)]
+        if args.pages:
+            cmd += ["--pages", args.pages]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{name:<12}недоступен")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{name:<12}{r['pages']:>9}{r['median_ms']:>14.2f}{r['p95_ms']:>10.2f}"
+              f"{r['py_peak_kb']:>14.0f}{r['rss_growth_kb']:>12}")
+
+
+if __name__ == "__main__":
+    main()
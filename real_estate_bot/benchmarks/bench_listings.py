@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Скорость ListingExtractor (объявлений в секунду) на сохранённых страницах выдачи.
+#
+#   python bench_listings.py [--pages DIR] [--backend NAME] [--history FILE]
+#
+# Результаты дописываются в файл истории; если скорость упала сильнее
+# --max-slowdown относительно предыдущего запуска на тех же страницах,
+# скрипт завершается с кодом 1. Страница без объявлений — тоже ошибка:
+# так видно, что разметка сайта поменялась и селекторы перестали работать.
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from pages import load_pages
+
+
+def pages_fingerprint(pages):
+    digest = hashlib.sha1()
+    for name, html in pages:
+        digest.update(name.encode("utf-8"))
+        digest.update(html.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def measure(extractor, pages, repeat):
+    rates = []
+    items = 0
+    for _ in range(repeat):
+        count = 0
+        started = time.perf_counter()
+        for _, html in pages:
+            count += len(extractor.extract(html))
+        rates.append(count / (time.perf_counter() - started))
+        items = count
+    return items, statistics.median(rates)
+
+
+def main():
+    from extract import get_backend
+    from listings import ListingExtractor
+
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--pages", help="каталог с сохранёнными страницами выдачи")
+    arg_parser.add_argument("--backend", help="selectolax, lxml или bs4")
+    arg_parser.add_argument("--deal", choices=["rent", "sale"], default="sale")
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    arg_parser.add_argument("--history", default="bench_history.json")
+    arg_parser.add_argument("--max-slowdown", type=float, default=0.2)
+    args = arg_parser.parse_args()
+
+    pages = load_pages(args.pages)
+    backend = get_backend(args.backend)
+    extractor = ListingExtractor(args.deal, backend)
+
+    empty = [name for name, html in pages if not extractor.extract(html)]
+    for name in empty:
+        print(f"Нет объявлений на странице {name}")
+
+    items, rate = measure(extractor, pages, args.repeat)
+    result = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "backend": backend.name,
+        "pages": pages_fingerprint(pages),
+        "items": items,
+        "items_per_sec": round(rate, 1),
+    }
+    print(f"{backend.name}: {items} объявлений на {len(pages)} страницах, {rate:.0f} объявлений/с")
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, encoding="utf-8") as f:
+            history = json.load(f)
+    previous = next((r for r in reversed(history)
+                     if r["backend"] == result["backend"] and r["pages"] == result["pages"]), None)
+    history.append(result)
+    with open(args.history, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+    if previous:
+        change = rate / previous["items_per_sec"] - 1
+        print(f"Относительно {previous['date']}: {change:+.1%}")
+        if change < -args.max_slowdown:
+            sys.exit(1)
+    if empty:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
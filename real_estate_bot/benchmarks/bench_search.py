@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# Нагрузочный тест поиска: rent()/buy() веб-приложения под N одновременными
+# клиентами и доставка результатов в Telegram через заглушку с задержкой и 429.
+#
+#   python bench_search.py --seed --rows 100000     # синтетические объявления в БД из .env
+#   python bench_search.py --clients 20 --requests 50
+#   python bench_search.py --url http://127.0.0.1:8000 --telegram-port 8081
+#   python bench_search.py --clean                  # удалить синтетические данные
+#
+# Без --url запросы идут через Flask test client в этом же процессе, а
+# отправка в Telegram — в заглушку fake_telegram.py. С --url нагружается
+# запущенный сервер; чтобы мерить доставку, его нужно запустить с
+# TELEGRAM_API_URL=http://127.0.0.1:<--telegram-port>.
+#
+# Синтетические строки помечены городом «Бенчмарк» и avito_id от BENCH_ID_BASE.
+# Набор запросов зависит только от --random-seed, поэтому запуски на разных коммитах
+# сравнимы: результаты дописываются в историю, и при росте p95 больше
+# --max-slowdown относительно прошлого запуска с теми же параметрами скрипт
+# завершается с кодом 1.
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pages import ROOMS
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web")
+
+BENCH_CITY = "Бенчмарк"
+BENCH_ID_BASE = 9_000_000_000_000
+# chat_id клиентов нагрузки, чтобы не пересекаться с настоящими пользователями
+CHAT_ID_BASE = 8_000_000_000
+DISTRICTS = 12
+STATIONS = 24
+PROPERTY_TYPES = ("новостройка", "вторичка")
+PRICES = {"rent": (20_000, 200_000), "sale": (3_000_000, 40_000_000)}
+
+
+def connect():
+    import psycopg2
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        port=os.getenv("DB_PORT", "5433"),
+    )
+
+
+def bump_generations(cur):
+    # Кэш веб-приложения должен увидеть новые данные так же, как после батча парсера
+    from invalidation import generation_hook
+
+    for table in ("rental", "sale"):
+        generation_hook(table)(cur, [None])
+
+
+def seed_places(cur):
+    places = {"district": [f"Район {n}" for n in range(1, DISTRICTS + 1)],
+              "metro": [f"Станция {n}" for n in range(1, STATIONS + 1)]}
+    ids = {}
+    for kind, names in places.items():
+        ids[kind] = []
+        for name in names:
+            cur.execute("""
+                INSERT INTO geo_places (city, kind, name) VALUES (%s, %s, %s)
+                ON CONFLICT (city, kind, name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id
+            """, (BENCH_CITY, kind, name))
+            ids[kind].append(cur.fetchone()[0])
+    return ids
+
+
+def synthetic_rows(deal, rows, places, rnd):
+    # Те же строки комнат, что на страницах выдачи, и те же производные
+    # колонки, что пишет парсер
+    from normalize import content_hash, parse_area, parse_price, parse_rooms
+
+    low, high = PRICES[deal]
+    for n in range(rows):
+        rooms = rnd.choice(ROOMS)
+        area = f"{rnd.uniform(18, 140):.1f}".replace(".", ",")
+        price = f"{rnd.randrange(low, high, 1000):,} ₽".replace(",", " ")
+        house = str(rnd.randint(1, 200))
+        address = f"ул. Тестовая, {house}"
+        property_type = rnd.choice(PROPERTY_TYPES) if deal == "sale" else None
+        avito_id = BENCH_ID_BASE + n
+        row = (address, price, rooms, area, f"https://www.avito.ru/bench/kvartira_{avito_id}",
+               parse_price(price), parse_area(area), parse_rooms(rooms), avito_id,
+               content_hash(address, price, rooms, area, property_type), BENCH_CITY,
+               "улица Тестовая", house, rnd.choice(places["district"]), rnd.choice(places["metro"]))
+        if deal == "sale":
+            row = row[:1] + (property_type,) + row[1:]
+        yield row
+
+
+def seed(rows, seed_value):
+    from psycopg2.extras import execute_values
+    from market_stats import MarketStats
+
+    columns = ("address", "price", "rooms", "area", "link", "price_rub", "area_m2", "rooms_n", "avito_id",
+               "content_hash", "city", "street", "house", "district_id", "metro_id")
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            places = seed_places(cur)
+            for deal, table in (("rent", "rental"), ("sale", "sale")):
+                table_columns = columns[:1] + ("property_type",) + columns[1:] if deal == "sale" else columns
+                rnd = random.Random(f"{seed_value}:{deal}")
+                batch = []
+                for row in synthetic_rows(deal, rows, places, rnd):
+                    batch.append(row)
+                    if len(batch) >= 5000:
+                        execute_values(cur, f"INSERT INTO {table} ({', '.join(table_columns)}) VALUES %s "
+                                            "ON CONFLICT (avito_id) DO NOTHING", batch, page_size=len(batch))
+                        batch = []
+                if batch:
+                    execute_values(cur, f"INSERT INTO {table} ({', '.join(table_columns)}) VALUES %s "
+                                        "ON CONFLICT (avito_id) DO NOTHING", batch, page_size=len(batch))
+                groups = {(BENCH_CITY, rooms_n, district_id)
+                          for rooms_n in range(6) for district_id in [0] + places["district"]}
+                MarketStats(deal).refresh(cur, groups)
+                print(f"{table}: {rows} синтетических объявлений")
+            bump_generations(cur)
+        conn.commit()
+        with conn.cursor() as cur:
+            conn.autocommit = True
+            cur.execute("ANALYZE rental")
+            cur.execute("ANALYZE sale")
+    finally:
+        conn.close()
+
+
+def clean():
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            for table in ("rental", "sale"):
+                cur.execute(f"DELETE FROM {table} WHERE city = %s AND avito_id >= %s", (BENCH_CITY, BENCH_ID_BASE))
+                print(f"{table}: удалено {cur.rowcount}")
+            cur.execute("DELETE FROM market_stats WHERE city = %s", (BENCH_CITY,))
+            cur.execute("DELETE FROM geo_places WHERE city = %s", (BENCH_CITY,))
+            bump_generations(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_places():
+    # id синтетических районов и станций для фильтров; без БД — без них
+    try:
+        conn = connect()
+    except Exception as e:
+        print(f"БД недоступна, запросы без фильтра по месту: {e}")
+        return {"district": [], "metro": []}
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT kind, id FROM geo_places WHERE city = %s ORDER BY id", (BENCH_CITY,))
+            places = {"district": [], "metro": []}
+            for kind, place_id in cur.fetchall():
+                places[kind].append(place_id)
+            return places
+    finally:
+        conn.close()
+
+
+def make_requests(count, places, rnd):
+    # Случайные фильтры в тех же полях, что отправляют формы rent_filters/buy_filters
+    requests = []
+    for _ in range(count):
+        path = rnd.choice(("/rent", "/buy"))
+        form = {"rooms": str(rnd.randint(0, 5)), "sort": rnd.choice("ncm")}
+        if rnd.random() < 0.5:
+            form["area"] = str(rnd.randint(20, 80))
+        if rnd.random() < 0.5:
+            low, high = PRICES["rent" if path == "/rent" else "sale"]
+            form["price"] = str(rnd.randrange(low * 2, high, 1000))
+        if places["district"] and rnd.random() < 0.3:
+            form["district"] = str(rnd.choice(places["district"]))
+        elif places["metro"] and rnd.random() < 0.3:
+            form["metro"] = str(rnd.choice(places["metro"]))
+        if path == "/buy":
+            form["type"] = rnd.choice(("any",) + PROPERTY_TYPES)
+        requests.append((path, form))
+    return requests
+
+
+def test_client_post(telegram_url):
+    # Веб-приложение в этом процессе; отправка идёт в заглушку
+    os.environ["TELEGRAM_API_URL"] = telegram_url
+    os.environ.setdefault("BOT_TOKEN", "bench")
+    sys.path.insert(0, WEB_DIR)
+    from app import app
+
+    local = threading.local()
+
+    def post(path, form):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        return local.client.post(path, data=form).status_code
+    return post
+
+
+def server_post(url):
+    import requests
+
+    local = threading.local()
+
+    def post(path, form):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        try:
+            return local.session.post(url + path, data=form, timeout=30).status_code
+        except requests.RequestException:
+            return "error"
+    return post
+
+
+def run_client(n, requests, post):
+    results = []
+    for i, (path, form) in enumerate(requests):
+        chat_id = CHAT_ID_BASE + n * 100_000 + i
+        started = time.perf_counter()
+        status = post(f"{path}?user_id={chat_id}", form)
+        results.append((path, time.perf_counter() - started, status, chat_id, time.monotonic()))
+    return results
+
+
+def percentiles(values):
+    # p50/p95/p99 в миллисекундах
+    if not values:
+        return None
+    if len(values) == 1:
+        values = values * 2
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": round(q[49] * 1000, 1), "p95": round(q[94] * 1000, 1), "p99": round(q[98] * 1000, 1)}
+
+
+def wait_delivery(fake, results, timeout):
+    # Время от ответа веб-приложения до успешного sendMessage в заглушке
+    pending = {chat_id: finished for _, _, status, chat_id, finished in results if status == 200}
+    delays = []
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for chat_id, finished in list(pending.items()):
+            delivered = fake.delivered_at(chat_id)
+            if delivered is not None:
+                delays.append(delivered - finished)
+                del pending[chat_id]
+        time.sleep(0.1)
+    return delays, len(pending)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fmt(stats):
+    return f"p50 {stats['p50']} мс, p95 {stats['p95']} мс, p99 {stats['p99']} мс" if stats else "нет данных"
+
+
+def main():
+    from fake_telegram import FakeTelegram
+
+    arg_parser = argparse.ArgumentParser(description="Нагрузочный тест поиска веб-приложения")
+    arg_parser.add_argument("--seed", action="store_true", help="заполнить БД синтетическими объявлениями и выйти")
+    arg_parser.add_argument("--clean", action="store_true", help="удалить синтетические объявления и выйти")
+    arg_parser.add_argument("--rows", type=int, default=100_000, help="объявлений на таблицу для --seed")
+    arg_parser.add_argument("--random-seed", type=int, default=0)
+    arg_parser.add_argument("--clients", type=int, default=10)
+    arg_parser.add_argument("--requests", type=int, default=50, help="запросов на клиента")
+    arg_parser.add_argument("--url", help="адрес запущенного веб-приложения вместо test client")
+    arg_parser.add_argument("--telegram-port", type=int, default=0)
+    arg_parser.add_argument("--telegram-latency", type=float, default=0.05)
+    arg_parser.add_argument("--telegram-429", type=float, default=0.05, help="доля ответов 429")
+    arg_parser.add_argument("--drain", type=float, default=60, help="сколько ждать доставки после нагрузки, сек")
+    arg_parser.add_argument("--history", default="bench_search_history.json")
+    arg_parser.add_argument("--max-slowdown", type=float, default=0.2)
+    args = arg_parser.parse_args()
+
+    if args.seed:
+        seed(args.rows, args.random_seed)
+        return
+    if args.clean:
+        clean()
+        return
+
+    places = load_places()
+    rnd = random.Random(args.random_seed)
+    plans = [make_requests(args.requests, places, rnd) for _ in range(args.clients)]
+
+    with FakeTelegram(port=args.telegram_port, latency=args.telegram_latency, rate_limited=args.telegram_429,
+                      seed=args.random_seed) as fake:
+        post = server_post(args.url.rstrip("/")) if args.url else test_client_post(fake.url)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            results = [row for rows in executor.map(run_client, range(args.clients), plans, [post] * args.clients)
+                       for row in rows]
+        elapsed = time.perf_counter() - started
+        delays, undelivered = wait_delivery(fake, results, args.drain)
+        telegram = fake.metrics()
+
+    errors = sum(1 for _, _, status, _, _ in results if status != 200)
+    result = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": {"mode": "server" if args.url else "test_client", "clients": args.clients,
+                   "requests": args.requests, "random_seed": args.random_seed,
+                   "places": bool(places["district"]), "telegram_latency": args.telegram_latency,
+                   "telegram_429": args.telegram_429},
+        "requests": len(results),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "throughput": round(len(results) / elapsed, 1),
+        "latency": percentiles([latency for _, latency, _, _, _ in results]),
+        "rent": percentiles([latency for path, latency, _, _, _ in results if path == "/rent"]),
+        "buy": percentiles([latency for path, latency, _, _, _ in results if path == "/buy"]),
+        "delivery": percentiles(delays),
+        "undelivered": undelivered,
+        "telegram": telegram,
+    }
+
+    print(f"rent: {fmt(result['rent'])}")
+    print(f"buy: {fmt(result['buy'])}")
+    print(f"всего: {result['requests']} запросов за {result['seconds']} с, {result['throughput']} запросов/с, "
+          f"ошибок {errors}; {fmt(result['latency'])}")
+    print(f"доставка в Telegram: {len(delays)} сообщений, {fmt(result['delivery'])}, "
+          f"не доставлено {undelivered}, ответов 429: {telegram['rate_limited']}")
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, encoding="utf-8") as f:
+            history = json.load(f)
+    previous = next((r for r in reversed(history) if r.get("params") == result["params"]), None)
+    history.append(result)
+    with open(args.history, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+    if previous and previous["latency"] and result["latency"]:
+        change = result["latency"]["p95"] / previous["latency"]["p95"] - 1
+        print(f"Относительно {previous['date']} ({previous['commit']}): p95 {change:+.1%}, "
+              f"пропускная способность {result['throughput'] / previous['throughput'] - 1:+.1%}")
+        if change > args.max_slowdown:
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Заглушка Telegram Bot API для нагрузочного теста: отвечает на любой метод
+# с заданной задержкой и долей ответов 429, запоминает время успешной
+# доставки по chat_id. Веб-приложение направляется на неё через
+# TELEGRAM_API_URL.
+#
+#   python fake_telegram.py --port 8081 --latency 0.05 --rate-limited 0.05
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTelegram:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.5, rate_limited=0.0, retry_after=1,
+                 seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.delivered = {}  # chat_id -> время доставки (time.monotonic)
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _decide(self):
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+            limited = self.random.random() < self.rate_limited
+            self.stats["rate_limited" if limited else "ok"] += 1
+        return delay, limited
+
+    def _delivered(self, chat_id):
+        with self.lock:
+            self.delivered.setdefault(chat_id, time.monotonic())
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                delay, limited = fake._decide()
+                time.sleep(delay)
+                if limited:
+                    self._reply(429, {"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {fake.retry_after}",
+                                      "parameters": {"retry_after": fake.retry_after}})
+                    return
+                try:
+                    chat_id = json.loads(body or b"{}").get("chat_id")
+                except ValueError:
+                    chat_id = None
+                if chat_id is not None:
+                    fake._delivered(str(chat_id))
+                self._reply(200, {"ok": True, "result": {"message_id": 1}})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delivered_at(self, chat_id):
+        with self.lock:
+            return self.delivered.get(str(chat_id))
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, delivered=len(self.delivered))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    arg_parser.add_argument("--port", type=int, default=8081)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка ответа, сек")
+    arg_parser.add_argument("--rate-limited", type=float, default=0.05, help="доля ответов 429")
+    arg_parser.add_argument("--retry-after", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    fake = FakeTelegram(port=args.port, latency=args.latency, rate_limited=args.rate_limited,
+                        retry_after=args.retry_after)
+    print(f"Заглушка Telegram на {fake.url}, запустите веб-приложение с TELEGRAM_API_URL={fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(fake.metrics()))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+import random
+import sys
+
+# Бенчмарки импортируют модули парсера напрямую, без запуска parser.py
+PARSER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "parser")
+if PARSER_DIR not in sys.path:
+    sys.path.insert(0, PARSER_DIR)
+
+ROOMS = ["Квартира-студия", "1-к. квартира", "2-к. квартира", "3-к. квартира", "4-к. квартира", "5-к. квартира"]
+
+CARD = """
+<div data-marker="item" class="iva-item-root" data-item-id="{item_id}">
+  <div class="iva-item-slider"><img src="/img/{item_id}.jpg" alt=""></div>
+  <div class="iva-item-body">
+    <a data-marker="item-title" itemprop="url" href="/sankt-peterburg/kvartiry/{slug}_{item_id}">
+      <h3 itemprop="name" class="title-root">{rooms}, {area} м², {floor}/{floors} эт.</h3>
+    </a>
+    <div class="price-root">
+      <meta itemprop="priceCurrency" content="RUB">
+      <meta itemprop="price" content="{price}">
+      <span data-marker="item-price"><span>{price_text}</span></span>
+    </div>
+    <div data-marker="item-address"><div class="geo-root">
+      <span class="geo-address">ул. Тестовая, {house}</span>
+      <div class="geo-georeferences"><span>{metro}</span><span>{minutes} мин.</span></div>
+    </div></div>
+    <div class="iva-item-description"><p>{description}</p></div>
+  </div>
+</div>
+"""
+
+
+def synthetic_page(n_items=50, seed=0):
+    # Разметка повторяет структуру карточек, под которую написаны селекторы
+    rnd = random.Random(seed)
+    cards = []
+    for i in range(n_items):
+        price = rnd.randrange(25_000, 25_000_000, 1000)
+        cards.append(CARD.format(
+            item_id=4_000_000_000 + seed * 10_000 + i,
+            slug="kvartira",
+            rooms=rnd.choice(ROOMS),
+            area=f"{rnd.uniform(18, 140):.1f}".replace(".", ","),
+            floor=rnd.randint(1, 9),
+            floors=rnd.randint(9, 25),
+            price=price,
+            price_text=f"{price:,} ₽".replace(",", " "),
+            house=rnd.randint(1, 200),
+            metro=rnd.choice(["Купчино", "Звёздная", "Парнас", "Девяткино"]),
+            minutes=rnd.randint(3, 30),
+            description=rnd.choice(["Новостройка, сдача в этом году", "Вторичное жильё", "Апартаменты"]),
+        ))
+    return "<html><body><div data-marker=\"catalog-serp\">" + "".join(cards) + "</div></body></html>"
+
+
+def load_pages(directory=None, synthetic=5):
+    # Сохранённые страницы (PARSER_SNAPSHOT_DIR) или синтетические, если их нет
+    directory = directory or os.getenv("PARSER_SNAPSHOT_DIR")
+    if directory:
+        paths = sorted(glob.glob(os.path.join(directory, "*.html")))
+        if paths:
+            pages = []
+            for path in paths:
+                with open(path, encoding="utf-8") as f:
+                    pages.append((os.path.basename(path), f.read()))
+            return pages
+    return [(f"synthetic_{n}.html", synthetic_page(seed=n)) for n in range(synthetic)]
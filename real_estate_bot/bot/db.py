@@ -0,0 +1,36 @@
+import os
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "database": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "port": os.getenv("DB_PORT", "5433")
+}
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+STATEMENT_TIMEOUT_MS = os.getenv("DB_STATEMENT_TIMEOUT_MS", "3000")
+
+pool = None
+
+
+async def create_pool():
+    global pool
+    pool = await asyncpg.create_pool(
+        min_size=POOL_MIN,
+        max_size=POOL_MAX,
+        server_settings={"statement_timeout": STATEMENT_TIMEOUT_MS},
+        **DB_CONFIG
+    )
+    return pool
+
+
+async def close_pool():
+    if pool is not None:
+        await pool.close()
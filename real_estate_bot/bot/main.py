@@ -1,14 +1,24 @@
 import os
 import asyncio
+import logging
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.enums import ParseMode
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
 
+import db
+from metrics import TelegramMetrics, start_metrics_server
+from search import (ROOM_LABELS, PROPERTY_TYPES, PLACE_KINDS, SORT_LABELS, Page, search, format_results,
+                    find_places, market_summary, format_market, parse_area, save_subscription, cancel_subscriptions)
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 # ✅ Новый способ задания parse_mode:
@@ -17,12 +27,24 @@ bot = Bot(
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
+bot.session.middleware(TelegramMetrics())
+
 dp = Dispatcher(storage=MemoryStorage())
 
 
+class SearchForm(StatesGroup):
+    rooms = State()
+    area = State()
+    location = State()
+    property_type = State()
+
+
 @dp.message(F.text == "/start")
-async def start_handler(message: Message):
+async def start_handler(message: Message, state: FSMContext):
+    await state.clear()
     kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Аренда", callback_data="deal:rent"),
+         InlineKeyboardButton(text="Покупка", callback_data="deal:sale")],
         [InlineKeyboardButton(
             text="Настрой фильтры для поиска жилья",
             url=f"http://127.0.0.1:8000?user_id={message.chat.id}"
@@ -31,7 +53,181 @@ async def start_handler(message: Message):
     await message.answer("Выберите категорию и настройте фильтры:", reply_markup=kb)
 
 
+@dp.callback_query(F.data.startswith("deal:"))
+async def deal_handler(callback: CallbackQuery, state: FSMContext):
+    deal = callback.data.split(":", 1)[1]
+    await state.clear()
+    await state.update_data(deal=deal)
+    await state.set_state(SearchForm.rooms)
+
+    buttons = [InlineKeyboardButton(text=label, callback_data=f"rooms:{n}") for n, label in ROOM_LABELS.items()]
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        buttons[:3],
+        buttons[3:],
+        [InlineKeyboardButton(text="Любое", callback_data="rooms:any")],
+    ])
+    await callback.message.answer("Количество комнат:", reply_markup=kb)
+    await callback.answer()
+
+
+@dp.callback_query(SearchForm.rooms, F.data.startswith("rooms:"))
+async def rooms_handler(callback: CallbackQuery, state: FSMContext):
+    value = callback.data.split(":", 1)[1]
+    await state.update_data(rooms=None if value == "any" else int(value))
+    await state.set_state(SearchForm.area)
+    await callback.message.answer("Минимальная площадь, м² (0 — без ограничения):")
+    await callback.answer()
+
+
+@dp.message(SearchForm.area)
+async def area_handler(message: Message, state: FSMContext):
+    try:
+        min_area = parse_area(message.text)
+    except ValueError:
+        await message.answer("Введите площадь от 0 до 999999 м², например: 42.5")
+        return
+
+    await state.update_data(min_area=min_area)
+    await state.set_state(SearchForm.location)
+    await message.answer("Район или станция метро («-» — любые):")
+
+
+@dp.message(SearchForm.location)
+async def location_handler(message: Message, state: FSMContext):
+    text = (message.text or "").strip()
+    if text in ("", "-", "0"):
+        await ask_property_type(message, state)
+        return
+
+    places = await find_places(text)
+    if not places:
+        await message.answer("Не нашёл такой район или станцию. Попробуйте ещё раз или отправьте «-».")
+        return
+    if len(places) == 1:
+        await state.update_data({places[0]["kind"]: places[0]["id"]})
+        await ask_property_type(message, state)
+        return
+
+    # Одно название в разных городах или и район, и станция
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{p['name']} ({PLACE_KINDS[p['kind']]}, {p['city']})",
+                              callback_data=f"place:{p['kind']}:{p['id']}")]
+        for p in places
+    ])
+    await message.answer("Уточните:", reply_markup=kb)
+
+
+@dp.callback_query(SearchForm.location, F.data.startswith("place:"))
+async def place_handler(callback: CallbackQuery, state: FSMContext):
+    _, kind, place_id = callback.data.split(":")
+    await state.update_data({kind: int(place_id)})
+    await callback.answer()
+    await ask_property_type(callback.message, state)
+
+
+async def ask_property_type(message: Message, state: FSMContext):
+    data = await state.get_data()
+    if data["deal"] == "sale":
+        await state.set_state(SearchForm.property_type)
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Любой", callback_data="type:any")],
+            [InlineKeyboardButton(text=t.capitalize(), callback_data=f"type:{t}") for t in PROPERTY_TYPES],
+        ])
+        await message.answer("Тип жилья:", reply_markup=kb)
+        return
+
+    await run_search(message, state)
+
+
+@dp.callback_query(SearchForm.property_type, F.data.startswith("type:"))
+async def property_type_handler(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(property_type=callback.data.split(":", 1)[1])
+    await callback.answer()
+    await run_search(callback.message, state)
+
+
+async def run_search(message: Message, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    # Фильтры последнего поиска остаются в данных — для кнопки подписки
+    await state.set_data({"last_search": data})
+    page = Page(data["deal"], rooms=data.get("rooms"), min_area=data.get("min_area"),
+                property_type=data.get("property_type"), district=data.get("district"), metro=data.get("metro"))
+    await send_page(message, page)
+
+
+async def send_page(message: Message, page: Page):
+    rows, next_page = await search(page)
+    buttons = []
+    next_data = next_page.button_data() if next_page else None
+    if next_data:
+        buttons.append([InlineKeyboardButton(text="Далее ▶", callback_data=next_data)])
+    sorts = {sort: page.resorted(sort).button_data() for sort in SORT_LABELS if sort != page.sort}
+    buttons.append([
+        InlineKeyboardButton(text=SORT_LABELS[sort], callback_data=data)
+        for sort, data in sorts.items() if data
+    ])
+    buttons.append([InlineKeyboardButton(text="🔔 Присылать новые объявления", callback_data="subscribe")])
+    await message.answer(format_results(rows), disable_web_page_preview=True,
+                         reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+
+@dp.callback_query(F.data.startswith("pg:"))
+async def page_handler(callback: CallbackQuery):
+    # Следующая страница или другая сортировка — в том числе для сообщений,
+    # отправленных веб-приложением
+    try:
+        page = Page.unpack(callback.data)
+    except ValueError:
+        await callback.answer("Устаревшая кнопка, выполните поиск заново", show_alert=True)
+        return
+    await callback.answer()
+    await send_page(callback.message, page)
+
+
+@dp.callback_query(F.data == "subscribe")
+async def subscribe_handler(callback: CallbackQuery, state: FSMContext):
+    data = (await state.get_data()).get("last_search")
+    if not data:
+        await callback.answer("Сначала выполните поиск", show_alert=True)
+        return
+    try:
+        await save_subscription(callback.message.chat.id, data["deal"], data.get("rooms"),
+                                data.get("min_area"), data.get("property_type"))
+    except Exception as e:
+        logger.error(f"Ошибка сохранения подписки: {e}", exc_info=True)
+        await callback.answer("Не удалось сохранить подписку, попробуйте позже", show_alert=True)
+        return
+    await callback.answer()
+    await callback.message.answer("Подписка сохранена. Отписаться: /unsubscribe")
+
+
+@dp.message(F.text.startswith("/stats"))
+async def stats_handler(message: Message):
+    # /stats — медианы по городу, /stats Приморский — по району
+    name = message.text.removeprefix("/stats").strip()
+    if not name:
+        await message.answer(format_market(await market_summary(), "весь город"))
+        return
+    districts = [place for place in await find_places(name) if place["kind"] == "district"]
+    if not districts:
+        await message.answer("Район не найден. Пример: /stats Приморский")
+        return
+    for place in districts:
+        await message.answer(format_market(await market_summary(place["id"]),
+                                           f"{place['name']} район, {place['city']}"))
+
+
+@dp.message(F.text == "/unsubscribe")
+async def unsubscribe_handler(message: Message):
+    await cancel_subscriptions(message.chat.id)
+    await message.answer("Уведомления о новых объявлениях отключены.")
+
+
 async def main():
+    start_metrics_server()
+    dp.startup.register(db.create_pool)
+    dp.shutdown.register(db.close_pool)
     await dp.start_polling(bot)
 
 
@@ -0,0 +1,54 @@
+import logging
+import os
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from prometheus_client import Counter, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-листенера /metrics; 0 — не запускать
+METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "9102"))
+
+SEARCH_SECONDS = Histogram(
+    "bot_search_query_seconds", "Запрос поиска к БД", ["deal", "shape", "sort"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 3))
+TELEGRAM_REQUEST_SECONDS = Histogram(
+    "bot_telegram_request_seconds", "Запрос к Telegram Bot API", ["method", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+TELEGRAM_RATE_LIMITED = Counter("bot_telegram_rate_limited_total", "Ответы 429 от Telegram", ["method"])
+
+
+class TelegramMetrics(BaseRequestMiddleware):
+    # Время и результат каждого вызова Bot API, включая ответы бота
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        status = "ok"
+        started = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            status = "429"
+            TELEGRAM_RATE_LIMITED.labels(name).inc()
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            TELEGRAM_REQUEST_SECONDS.labels(name, status).observe(time.monotonic() - started)
+
+
+def filter_shape(**filters):
+    # Набор заданных фильтров без значений: rooms+price, area, none...
+    return "+".join(name for name, value in filters.items() if value) or "none"
+
+
+def start_metrics_server(port=METRICS_PORT):
+    if not port:
+        return
+    try:
+        start_http_server(port)
+        logger.info(f"Метрики доступны на :{port}/metrics")
+    except OSError as e:
+        logger.warning(f"Не удалось открыть порт метрик {port}: {e}")
@@ -0,0 +1,291 @@
+import math
+import time
+from decimal import Decimal, InvalidOperation
+from html import escape
+
+import db
+from metrics import SEARCH_SECONDS, filter_shape
+
+# Сделка -> таблица объявлений
+TABLES = {"rent": "rental", "sale": "sale"}
+
+ROOM_LABELS = {
+    0: "Студия",
+    1: "1-комнатная",
+    2: "2-комнатная",
+    3: "3-комнатная",
+    4: "4-комнатная",
+    5: "5-комнатная",
+}
+
+PROPERTY_TYPES = ("новостройка", "вторичка")
+
+# Те же пределы, что у веб-формы: area_m2 и min_area — NUMERIC(8, 2)
+MAX_AREA = 999999
+
+PAGE_SIZE = 5
+
+# Telegram отклоняет всё сообщение, если callback_data кнопки длиннее 64 байт
+CALLBACK_DATA_LIMIT = 64
+
+# Сортировка -> (выражение ключа, направление); совпадает с web/paging.py
+SORTS = {
+    "n": ("id", "DESC"),  # сначала новые
+    "c": ("price_rub", "ASC"),  # сначала дешевле
+    "m": ("ROUND(price_rub::numeric / NULLIF(area_m2, 0), 2)", "ASC"),  # по цене за м²
+}
+
+SORT_LABELS = {"n": "Новые", "c": "Дешевле", "m": "Цена за м²"}
+
+PROPERTY_TYPE_CODES = {"новостройка": "n", "вторичка": "v"}
+
+PLACE_KINDS = {"district": "район", "metro": "метро"}
+PLACE_WORDS = {"м", "м.", "метро", "ст.", "станция", "р-н", "район"}
+
+
+class Page:
+    # Фильтры, сортировка и курсор (ключ и id последней показанной строки).
+    # Упаковывается в callback_data кнопок, поэтому формат компактный:
+    #   pg:<сделка r|s>:<сортировка n|c|m>:<комнаты>:<площадь>:<цена>:<тип n|v>:<ключ>:<id>:<район>:<метро>
+    # Район и метро — id из geo_places; в кнопках старого формата их нет.
+    __slots__ = ("deal", "sort", "rooms", "min_area", "max_price", "property_type", "key", "last_id",
+                 "district", "metro")
+
+    def __init__(self, deal, sort="n", rooms=None, min_area=None, max_price=None, property_type=None,
+                 key=None, last_id=None, district=None, metro=None):
+        self.deal = deal
+        self.sort = sort if sort in SORTS else "n"
+        self.rooms = rooms
+        self.min_area = min_area
+        self.max_price = max_price
+        self.property_type = property_type if property_type in PROPERTY_TYPES else None
+        self.key = key
+        self.last_id = last_id
+        self.district = district
+        self.metro = metro
+
+    def pack(self):
+        def fmt(value):
+            if value is None:
+                return ""
+            return f"{value:g}" if isinstance(value, float) else str(value)
+
+        return ":".join([
+            "pg",
+            "r" if self.deal == "rent" else "s",
+            self.sort,
+            fmt(self.rooms),
+            fmt(self.min_area),
+            fmt(self.max_price),
+            PROPERTY_TYPE_CODES.get(self.property_type, ""),
+            fmt(self.key),
+            fmt(self.last_id),
+            fmt(self.district),
+            fmt(self.metro),
+        ])
+
+    def button_data(self):
+        # callback_data для кнопки или None, если курсор не помещается
+        data = self.pack()
+        return data if len(data.encode()) <= CALLBACK_DATA_LIMIT else None
+
+    @classmethod
+    def unpack(cls, data):
+        # Для испорченной или устаревшей кнопки — ValueError
+        parts = data.split(":")
+        if len(parts) == 9:
+            parts += ["", ""]
+        _, deal, sort, rooms, area, price, ptype, key, last_id, district, metro = parts
+        types = {code: name for name, code in PROPERTY_TYPE_CODES.items()}
+        # Ключ сортировки по цене — BIGINT, по цене за м² — NUMERIC.
+        # Пустой ключ — нет курсора; цена 0 ₽ — настоящий ключ
+        if key == "":
+            key = None
+        elif sort == "c":
+            key = int(key)
+        else:
+            try:
+                key = Decimal(key)
+            except InvalidOperation:
+                raise ValueError(f"Некорректный ключ сортировки: {key}")
+            if not key.is_finite():
+                raise ValueError(f"Некорректный ключ сортировки: {key}")
+        return cls(
+            "rent" if deal == "r" else "sale",
+            sort,
+            int(rooms) if rooms else None,
+            float(area.replace(",", ".")) if area else None,
+            int(price) if price else None,
+            types.get(ptype),
+            key,
+            int(last_id) if last_id else None,
+            int(district) if district else None,
+            int(metro) if metro else None,
+        )
+
+    def next(self, last_row):
+        return Page(self.deal, self.sort, self.rooms, self.min_area, self.max_price, self.property_type,
+                    None if self.sort == "n" else last_row["sort_key"], last_row["id"], self.district, self.metro)
+
+    def resorted(self, sort):
+        return Page(self.deal, sort, self.rooms, self.min_area, self.max_price, self.property_type,
+                    district=self.district, metro=self.metro)
+
+
+def build_query(page, limit=PAGE_SIZE):
+    # Те же фильтры, что у веб-форм rent()/buy(), но с плейсхолдерами asyncpg.
+    # Следующая страница выбирается по курсору (keyset), а не OFFSET,
+    # поэтому цена запроса не растёт с номером страницы.
+    key, direction = SORTS[page.sort]
+    query = f"SELECT address, price, rooms, area, link, id, {key} AS sort_key FROM {TABLES[page.deal]} WHERE TRUE"
+    args = []
+
+    if page.rooms is not None:
+        args.append(page.rooms)
+        query += f" AND rooms_n = ${len(args)}"
+
+    if page.min_area:
+        args.append(Decimal(str(page.min_area)))  # area_m2 — NUMERIC, asyncpg ждёт Decimal
+        query += f" AND area_m2 >= ${len(args)}"
+
+    if page.max_price:
+        args.append(page.max_price)
+        query += f" AND price_rub <= ${len(args)}"
+
+    if page.deal == "sale" and page.property_type:
+        args.append(page.property_type)
+        query += f" AND property_type = ${len(args)}"
+
+    if page.district:
+        args.append(page.district)
+        query += f" AND district_id = ${len(args)}"
+
+    if page.metro:
+        args.append(page.metro)
+        query += f" AND metro_id = ${len(args)}"
+
+    if page.sort == "n":
+        if page.last_id is not None:
+            args.append(page.last_id)
+            query += f" AND id < ${len(args)}"
+        query += " ORDER BY id DESC"
+    else:
+        query += f" AND {key} IS NOT NULL"
+        if page.last_id is not None:
+            args.append(page.key)
+            args.append(page.last_id)
+            query += f" AND ({key}, id) > (${len(args) - 1}, ${len(args)})"
+        query += f" ORDER BY {key} {direction}, id {direction}"
+
+    # Строка сверх страницы — признак того, что есть продолжение
+    args.append(limit + 1)
+    query += f" LIMIT ${len(args)}"
+    return query, args
+
+
+async def search(page):
+    query, args = build_query(page)
+    shape = filter_shape(rooms=page.rooms is not None, area=page.min_area, price=page.max_price,
+                         type=page.deal == "sale" and page.property_type, district=page.district, metro=page.metro)
+    started = time.monotonic()
+    async with db.pool.acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    SEARCH_SECONDS.labels(page.deal, shape, page.sort).observe(time.monotonic() - started)
+    next_page = page.next(rows[PAGE_SIZE - 1]) if len(rows) > PAGE_SIZE else None
+    return rows[:PAGE_SIZE], next_page
+
+
+def place_key(text):
+    # Как в индексе geo_places: без учёта регистра, ё/е и уточнений «м.», «р-н»
+    words = text.replace("ё", "е").lower().split()
+    words = [word for word in words if word not in PLACE_WORDS]
+    return " ".join(words)
+
+
+async def find_places(text):
+    # Район или станция метро по названию: равенство по индексу справочника
+    # вместо поиска подстроки в адресах объявлений
+    key = place_key(text)
+    if not key:
+        return []
+    async with db.pool.acquire() as conn:
+        return await conn.fetch("""
+            SELECT id, city, kind, name FROM geo_places
+            WHERE lower(replace(name, 'ё', 'е')) = $1
+            ORDER BY city, kind
+        """, key)
+
+
+async def market_summary(district_id=0):
+    # Готовые группы market_stats (её пересчитывает парсер): медианы по
+    # комнатам для всего города (district_id = 0) или одного района
+    async with db.pool.acquire() as conn:
+        return await conn.fetch("""
+            SELECT deal, city, rooms_n, listings,
+                   price_percentiles[51] AS price_median, ppm2_percentiles[51] AS ppm2_median
+            FROM market_stats
+            WHERE district_id = $1 AND listings > 0
+            ORDER BY city, deal, rooms_n
+        """, district_id)
+
+
+def format_market(rows, title):
+    if not rows:
+        return f"📊 Статистики по запросу «{escape(title)}» пока нет."
+
+    text = f"📊 <b>Цены: {escape(title)}</b>\n"
+    group = None
+    for r in rows:
+        if (r["city"], r["deal"]) != group:
+            group = (r["city"], r["deal"])
+            deal = "аренда, ₽ в месяц" if r["deal"] == "rent" else "продажа, ₽"
+            text += f"\n<b>{escape(r['city'])}, {deal}</b>\n"
+        label = ROOM_LABELS.get(r["rooms_n"], f"{r['rooms_n']}-комнатная")
+        price = f"{r['price_median']:,}".replace(",", " ")
+        ppm2 = f"{r['ppm2_median']:,.0f}".replace(",", " ")
+        text += f"{label}: медиана {price} ₽, {ppm2} ₽/м² ({r['listings']} объявл.)\n"
+    return text
+
+
+def format_results(rows):
+    if not rows:
+        return "🔍 По вашим фильтрам ничего не найдено.\n\nПопробуйте изменить параметры поиска."
+
+    text = "🏡 <b>Найдены подходящие предложения:</b>\n\n"
+    for r in rows:
+        text += f"📍 <b>Адрес:</b> {escape(r['address'] or '')}\n"
+        text += f"💵 <b>Цена:</b> {escape(r['price'] or '')}\n"
+        text += f"🛏 <b>Комнат:</b> {escape(r['rooms'] or '')}\n"
+        text += f"📏 <b>Площадь:</b> {escape(r['area'] or '')}\n"
+        if r['link']:
+            text += f"🔗 <a href=\"{escape(r['link'])}\">Ссылка на объявление</a>\n"
+        text += "\n"
+    return text
+
+
+def parse_area(text):
+    # Минимальная площадь из сообщения пользователя; ValueError — спросить ещё раз
+    area = float((text or "").replace(" ", "").replace(",", ".").strip())
+    if not math.isfinite(area) or not 0 <= area <= MAX_AREA:
+        raise ValueError(text)
+    return area
+
+
+async def save_subscription(chat_id, deal, rooms=None, min_area=None, property_type=None):
+    async with db.pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO subscriptions (chat_id, deal, rooms_n, min_area, property_type)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (chat_id, deal) DO UPDATE SET
+                rooms_n = EXCLUDED.rooms_n,
+                min_area = EXCLUDED.min_area,
+                max_price = NULL,
+                property_type = EXCLUDED.property_type,
+                active = TRUE
+        """, chat_id, deal, rooms, Decimal(str(min_area)) if min_area else None,
+            property_type if property_type in PROPERTY_TYPES else None)
+
+
+async def cancel_subscriptions(chat_id):
+    async with db.pool.acquire() as conn:
+        await conn.execute("UPDATE subscriptions SET active = FALSE WHERE chat_id = $1", chat_id)
@@ -0,0 +1,59 @@
+# Упаковка курсора в callback_data и разбор ввода: python -m pytest -q из каталога bot
+from decimal import Decimal
+
+import pytest
+
+from search import CALLBACK_DATA_LIMIT, SORTS, Page, build_query, parse_area
+
+KEYS = {"n": [None], "c": [0, 45000, 12500000], "m": [Decimal("0"), Decimal("0.00"), Decimal("512.35")]}
+
+
+@pytest.mark.parametrize("sort", sorted(SORTS))
+def test_round_trip(sort):
+    for key in KEYS[sort]:
+        for deal in ("rent", "sale"):
+            page = Page(deal, sort, rooms=0, min_area=42.5, max_price=50000,
+                        property_type="вторичка" if deal == "sale" else None,
+                        key=key, last_id=123, district=7, metro=15)
+            data = page.button_data()
+            assert data is not None and len(data.encode()) <= CALLBACK_DATA_LIMIT
+            restored = Page.unpack(data)
+            for name in Page.__slots__:
+                assert getattr(restored, name) == getattr(page, name), (sort, key, name)
+            assert restored.pack() == data
+
+
+def test_zero_price_key_keeps_cursor():
+    query, args = build_query(Page.unpack(Page("rent", "c", key=0, last_id=10).pack()))
+    assert "(price_rub, id) > ($1, $2)" in query
+    assert args[:2] == [0, 10]
+
+
+def test_legacy_nine_fields():
+    page = Page.unpack("pg:s:c:2::3000000:n:2500000:77")
+    assert (page.deal, page.rooms, page.property_type, page.key, page.last_id) == ("sale", 2, "новостройка",
+                                                                                   2500000, 77)
+    assert page.district is None and page.metro is None
+
+
+@pytest.mark.parametrize("data", [
+    "pg:r:m:::::abc:10::",
+    "pg:r:m:::::NaN:10::",
+    "pg:r:m:::::Infinity:10::",
+    "pg:r:c:::::1.5:10::",
+    "pg:r:c:::::x:10::",
+    "pg:r:n:x::::::",
+    "pg:r:n",
+])
+def test_invalid_data_raises_value_error(data):
+    with pytest.raises(ValueError):
+        Page.unpack(data)
+
+
+def test_parse_area():
+    assert parse_area(" 42,5 ") == 42.5
+    assert parse_area("0") == 0
+    assert parse_area("1 200") == 1200
+    for text in ("", "abc", "nan", "inf", "-5", "1e9", None):
+        with pytest.raises(ValueError):
+            parse_area(text)
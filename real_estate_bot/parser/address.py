@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_CACHE_SIZE = int(os.getenv("ADDRESS_CACHE_SIZE", "65536"))
+
+# Варианты написания типа улицы -> каноническое название
+STREET_TYPES = {
+    "ул": "улица", "улица": "улица",
+    "пр-т": "проспект", "пр-кт": "проспект", "просп": "проспект", "пр": "проспект", "проспект": "проспект",
+    "пер": "переулок", "переулок": "переулок",
+    "наб": "набережная", "набережная": "набережная",
+    "ш": "шоссе", "шоссе": "шоссе",
+    "б-р": "бульвар", "бул": "бульвар", "бульвар": "бульвар",
+    "пл": "площадь", "площадь": "площадь",
+    "пр-д": "проезд", "проезд": "проезд",
+    "ал": "аллея", "аллея": "аллея",
+    "дор": "дорога", "дорога": "дорога",
+    "лин": "линия", "линия": "линия",
+    "туп": "тупик", "тупик": "тупик",
+    "мкр": "микрорайон", "микрорайон": "микрорайон",
+}
+
+# Части адреса, которые не относятся к улице и дому
+_REGION_RE = re.compile(r"(?:^|\s)(?:обл\.?|область|край|россия|г\.)(?:\s|$)", re.IGNORECASE)
+_DISTRICT_RE = re.compile(r"^(?:р-н|район)\s+(.+)$|^(.+?)\s+(?:р-н|район)$", re.IGNORECASE)
+# Дом в начале части: "28", "д. 28", "28А", "28к2", "12/4 лит. Б". Буква после
+# номера — только если за ней не идёт строчная, цифра или дефис: "12Академическая" —
+# это дом 12 и станция, склеенные при извлечении текста карточки, а "37р-н" — дом и район
+_HOUSE_RE = re.compile(
+    r"^(?:д\.?\s*)?(?P<number>\d+(?:/\d+)?)(?P<letter>[а-яА-Я](?![а-яё\d-]))?"
+    r"(?:\s*(?:к\.?|корп\.?|корпус)\s*(?P<korpus>\d+))?"
+    r"(?:\s*(?:с\.?|стр\.?|строение)\s*(?P<building>\d+))?"
+    r"(?:\s*(?:лит\.?|литера)\s*(?P<litera>[а-яА-Я])(?![а-яё]))?")
+# Время или расстояние до метро после названия станции: "6–10 мин.", "от 31 мин.", "1,2 км"
+_DISTANCE_RE = re.compile(r"(?:от|до)?\s*\d+(?:[–-]\d+)?\s*мин\.?|\d+(?:[.,]\d+)?\s*к?м(?![а-яё])")
+_SPACES_RE = re.compile(r"\s+")
+# Запятая между частями адреса, но не в дробном расстоянии "1,2 км"
+_PARTS_RE = re.compile(r"(?<!\d),|,(?!\d)")
+
+
+@dataclass(frozen=True, slots=True)
+class Address:
+    street: str = None
+    house: str = None
+    district: str = None
+    metro: str = None
+
+
+def _clean(text):
+    return _SPACES_RE.sub(" ", text.replace("\xa0", " ")).strip(" ,.")
+
+
+def _capitalize(name):
+    return name[:1].upper() + name[1:] if name else name
+
+
+def _street_type(words):
+    for i, word in enumerate(words):
+        street_type = STREET_TYPES.get(word.lower().rstrip("."))
+        if street_type and len(words) > 1:
+            return i, street_type
+    return None, None
+
+
+def has_street_type(text):
+    return _street_type(_clean(text).split(" "))[1] is not None
+
+
+def normalize_street(text):
+    # "Невский пр-т", "пр. Невский" и "Невский проспект" -> "проспект Невский"
+    words = _clean(text).split(" ")
+    i, street_type = _street_type(words)
+    if street_type:
+        return f"{street_type} {' '.join(words[:i] + words[i + 1:])}"
+    return " ".join(words) or None
+
+
+def normalize_house(match):
+    house = match.group("number") + (match.group("letter") or "").lower()
+    if match.group("korpus"):
+        house += f"к{match.group('korpus')}"
+    if match.group("building"):
+        house += f"с{match.group('building')}"
+    if match.group("litera"):
+        house += f" лит. {match.group('litera').upper()}"
+    return house
+
+
+def parse_georeferences(text):
+    # Хвост карточки после адреса: станция метро с временем до неё или район
+    text = _clean(text)
+    if not text:
+        return None, None
+    district = _DISTRICT_RE.match(text)
+    if district:
+        return _capitalize(_clean(district.group(1) or district.group(2))), None
+    distance = _DISTANCE_RE.search(text)
+    metro = _clean(text[:distance.start()] if distance else text)
+    return None, metro or None
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def parse_address(raw, city=None):
+    # Разбор адреса из карточки: улица и дом в каноническом написании,
+    # район и станция метро. Текст карточки склеен без разделителей:
+    # "Невский пр-т, 28Маяковская6–10 мин.", поэтому всё, что идёт после
+    # номера дома, считается привязкой к метро или району.
+    # Одинаковые адреса встречаются постоянно — результат кэшируется.
+    if not raw:
+        return Address()
+    street = house = district = metro = None
+    typed = False
+    for part in _PARTS_RE.split(raw):
+        part = _clean(part)
+        if not part or (city and part.lower() in (city.lower(), f"г. {city.lower()}")):
+            continue
+        found = _DISTRICT_RE.match(part)
+        if found and street is None:
+            district = _capitalize(_clean(found.group(1) or found.group(2)))
+            continue
+        if _REGION_RE.search(part) and street is None:
+            continue
+        match = _HOUSE_RE.match(part) if street is not None and house is None else None
+        if match:
+            house = normalize_house(match)
+            tail_district, metro = parse_georeferences(part[match.end():])
+            district = district or tail_district
+        elif street is None or (not typed and house is None and has_street_type(part)):
+            # Населённый пункт перед улицей ("Мурино, Воронцовский б-р")
+            # заменяется улицей; дом без запятой: "Невский пр-т 28"
+            words = part.rsplit(" ", 1)
+            match = _HOUSE_RE.fullmatch(words[-1]) if len(words) > 1 else None
+            if match:
+                house = normalize_house(match)
+                part = words[0]
+            street = normalize_street(part)
+            typed = has_street_type(part)
+        elif metro is None and district is None:
+            district, metro = parse_georeferences(part)
+    return Address(street, house, district, metro)
+
+
+class PlaceLookup:
+    # Справочник районов и станций метро (таблица geo_places) в памяти
+    # процесса. Объявления ссылаются на место по id: фильтр по месту —
+    # равенство по индексу, а id помещается в callback_data кнопок бота.
+    # Справочник загружается целиком при первом обращении; новое название
+    # добавляется в таблицу при первой встрече, дальше берётся из кэша.
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.conn = None
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def _load(self):
+        self.conn = self.connect()
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT city, kind, name, id FROM geo_places")
+            self.ids = {(city, kind, name): place_id for city, kind, name, place_id in cur.fetchall()}
+        logger.info(f"Справочник мест загружен: {len(self.ids)}")
+
+    def resolve(self, city, kind, name):
+        if not name or not city:
+            return None
+        key = (city, kind, name)
+        place_id = self.ids.get(key)
+        if place_id is not None:
+            return place_id
+        with self.lock:
+            try:
+                if self.conn is None:
+                    self._load()
+                    if key in self.ids:
+                        return self.ids[key]
+                with self.conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO geo_places (city, kind, name) VALUES (%s, %s, %s)
+                        ON CONFLICT (city, kind, name) DO UPDATE SET name = EXCLUDED.name
+                        RETURNING id
+                    """, key)
+                    place_id = self.ids[key] = cur.fetchone()[0]
+                return place_id
+            except Exception as e:
+                logger.error(f"Не удалось получить id места {key}: {str(e)}")
+                self.close()
+                return None
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+
+def backfill_addresses(conn, table, places, batch_size=1000):
+    # Разбор адресов строк, сохранённых до появления колонок street/house/
+    # district_id/metro_id. Upsert обновляет только изменившиеся объявления,
+    # поэтому старые строки сами по себе не заполнятся.
+    last_id = 0
+    updated = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id, address, city FROM {table}
+                WHERE street IS NULL AND id > %s ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            values = []
+            for row_id, raw, city in rows:
+                address = parse_address(raw, city)
+                if address.street is None:
+                    continue
+                values.append((row_id, address.street, address.house,
+                               places.resolve(city, "district", address.district),
+                               places.resolve(city, "metro", address.metro)))
+            if values:
+                execute_values(cur, f"""
+                    UPDATE {table} AS t
+                    SET street = v.street, house = v.house, district_id = v.district_id, metro_id = v.metro_id
+                    FROM (VALUES %s) AS v (id, street, house, district_id, metro_id)
+                    WHERE t.id = v.id
+                """, values, template="(%s, %s, %s, %s::integer, %s::integer)", page_size=len(values))
+        conn.commit()
+        updated += len(values)
+        logger.info(f"Адреса {table}: разобрано {updated} строк, последний id {last_id}")
+    return updated
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+from html import escape
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTIONS_REFRESH = float(os.getenv("SUBSCRIPTIONS_REFRESH", "60"))
+# Сколько объявлений максимум в одном уведомлении
+ALERT_MAX_ITEMS = int(os.getenv("ALERT_MAX_ITEMS", "5"))
+
+
+class SubscriptionIndex:
+    # Подписки в памяти, сгруппированные по (сделка, комнаты, тип жилья).
+    # Внутри группы подписки отсортированы по минимальной площади, поэтому
+    # для объявления подходящие по площади находятся бинарным поиском,
+    # а не отдельным SQL-запросом на каждого пользователя.
+
+    def __init__(self, refresh=SUBSCRIPTIONS_REFRESH):
+        self.refresh = refresh
+        self.groups = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def load(self, cur):
+        cur.execute("""
+            SELECT chat_id, deal, rooms_n, min_area, max_price, property_type
+            FROM subscriptions WHERE active
+        """)
+        groups = {}
+        for chat_id, deal, rooms_n, min_area, max_price, property_type in cur.fetchall():
+            key = (deal, rooms_n, property_type)
+            groups.setdefault(key, []).append((float(min_area or 0), max_price, chat_id))
+        for subs in groups.values():
+            subs.sort(key=lambda sub: sub[0])
+        self.groups = {key: ([sub[0] for sub in subs], subs) for key, subs in groups.items()}
+        self.loaded_at = time.monotonic()
+        logger.info(f"Загружено подписок: {sum(len(subs) for _, subs in self.groups.values())}")
+
+    def ensure_fresh(self, cur):
+        with self.lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh:
+                self.load(cur)
+
+    def match(self, deal, rooms_n, area, price, property_type=None):
+        # chat_id всех подписок, под которые подходит объявление.
+        # None в подписке означает "любое значение".
+        chats = set()
+        for key in ((deal, rooms_n, property_type), (deal, None, property_type),
+                    (deal, rooms_n, None), (deal, None, None)):
+            group = self.groups.get(key)
+            if not group:
+                continue
+            areas, subs = group
+            end = bisect_right(areas, area if area is not None else 0)
+            for _, max_price, chat_id in subs[:end]:
+                if max_price is None or (price is not None and price <= max_price):
+                    chats.add(chat_id)
+        return chats
+
+
+SUBSCRIPTIONS = SubscriptionIndex()
+
+
+def format_alert(deal, listings):
+    title = "аренды" if deal == "rent" else "продажи"
+    text = f"🔔 <b>Новые объявления {title} по вашей подписке:</b>\n\n"
+    for price, rooms_n, area, address, link in listings[:ALERT_MAX_ITEMS]:
+        text += f"📍 <b>Адрес:</b> {escape(address or '')}\n"
+        text += f"💵 <b>Цена:</b> {escape(price or '')}\n"
+        if area is not None:
+            text += f"📏 <b>Площадь:</b> {area} м²\n"
+        if link:
+            text += f"🔗 <a href=\"{escape(link)}\">Ссылка на объявление</a>\n"
+        text += "\n"
+    if len(listings) > ALERT_MAX_ITEMS:
+        text += f"…и ещё {len(listings) - ALERT_MAX_ITEMS}"
+    return text
+
+
+def alerts_hook(deal):
+    # Новые объявления батча сопоставляются с подписками; на каждый чат —
+    # одно сообщение на батч в telegram_outbox. Отправка идёт через очередь
+    # доставки веб-приложения, которая соблюдает лимиты Telegram.
+    def notify(cur, returned):
+        new = [row for row in returned if row[8]]
+        if not new:
+            return
+        # Ошибка уведомлений не должна откатывать сохранение объявлений
+        cur.execute("SAVEPOINT alerts")
+        try:
+            send_alerts(cur, deal, new)
+            cur.execute("RELEASE SAVEPOINT alerts")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT alerts")
+            logger.error(f"Ошибка рассылки по подпискам ({deal}): {str(e)}", exc_info=True)
+    return notify
+
+
+def send_alerts(cur, deal, new):
+    SUBSCRIPTIONS.ensure_fresh(cur)
+
+    per_chat = {}
+    for row in new:
+        price, price_rub, area_m2, rooms_n, address, property_type, link = (
+            row[2], row[3], row[4], row[5], row[6], row[7], row[9])
+        area = float(area_m2) if area_m2 is not None else None
+        for chat_id in SUBSCRIPTIONS.match(deal, rooms_n, area, price_rub, property_type):
+            per_chat.setdefault(chat_id, []).append((price, rooms_n, area, address, link))
+
+    if not per_chat:
+        return
+    execute_values(cur, "INSERT INTO telegram_outbox (chat_id, payload) VALUES %s", [
+        (chat_id, json.dumps({
+            "chat_id": chat_id,
+            "text": format_alert(deal, listings),
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True,
+        }, ensure_ascii=False))
+        for chat_id, listings in per_chat.items()
+    ])
+    logger.info(f"Уведомлений по подпискам ({deal}): {len(per_chat)}")
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from metrics import CAPTCHAS
+
+logger = logging.getLogger(__name__)
+
+# Ручное решение капчи в окне браузера — только для отладки в терминале
+CAPTCHA_MANUAL = os.getenv("CAPTCHA_MANUAL", "0") == "1"
+CAPTCHA_MAX_ATTEMPTS = int(os.getenv("CAPTCHA_MAX_ATTEMPTS", "3"))
+CAPTCHA_BACKOFF = float(os.getenv("CAPTCHA_BACKOFF", "60"))
+CAPTCHA_MAX_BACKOFF = float(os.getenv("CAPTCHA_MAX_BACKOFF", "900"))
+
+
+class CaptchaDetected(Exception):
+    def __init__(self, url):
+        super().__init__(f"Капча на странице {url}")
+        self.url = url
+
+
+def manual_solving_enabled():
+    return CAPTCHA_MANUAL and sys.stdin is not None and sys.stdin.isatty()
+
+
+class CaptchaQueue:
+    # Отложенные страницы, на которых браузер получил капчу. Поток обхода
+    # не ждёт решения, а откладывает страницу и берёт следующую; повтор —
+    # не раньше чем через экспоненциально растущую паузу и в новом браузере.
+    # Заодно считает долю капч по потокам.
+
+    def __init__(self, max_attempts=CAPTCHA_MAX_ATTEMPTS, backoff=CAPTCHA_BACKOFF, max_backoff=CAPTCHA_MAX_BACKOFF):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.heap = []
+        self.counter = itertools.count()
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.abandoned = 0
+
+    def record(self, worker, captcha=False):
+        with self.lock:
+            stats = self.workers.setdefault(worker, {"pages": 0, "captchas": 0})
+            stats["pages"] += 1
+            if captcha:
+                stats["captchas"] += 1
+                CAPTCHAS.labels(str(worker)).inc()
+
+    def delay(self, attempts):
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+    def park(self, task):
+        # False — попытки исчерпаны, страница больше не повторяется
+        with self.lock:
+            attempts = self.attempts.get(task, 0) + 1
+            self.attempts[task] = attempts
+            if attempts >= self.max_attempts:
+                self.abandoned += 1
+                logger.error(f"Страница {task} пропущена: капча {attempts} раз подряд")
+                return False
+            delay = self.delay(attempts)
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), task))
+        logger.warning(f"Страница {task} отложена на {delay:.0f} с (капча, попытка {attempts})")
+        return True
+
+    def pop_due(self):
+        with self.lock:
+            if self.heap and self.heap[0][0] <= time.monotonic():
+                return heapq.heappop(self.heap)[2]
+            return None
+
+    def next_due(self):
+        # Сколько ждать ближайшей отложенной страницы; None — очередь пуста
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def __len__(self):
+        with self.lock:
+            return len(self.heap)
+
+    def metrics(self):
+        with self.lock:
+            workers = {
+                worker: dict(stats, rate=round(stats["captchas"] / stats["pages"], 3) if stats["pages"] else 0.0)
+                for worker, stats in self.workers.items()
+            }
+            return {"workers": workers, "parked": len(self.heap), "abandoned": self.abandoned}
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# Общие для точек входа парсера настройки и функции: подключение к БД,
+# браузер, загрузка страницы выдачи, строки таблиц объявлений и реестр
+# категорий. parser.py, crawler.py, pipeline.py и scheduler.py импортируют
+# их отсюда, поэтому parser.py, запущенный как __main__, не загружается
+# второй раз и SEEN, SOURCES и CATEGORIES существуют в одном экземпляре.
+import sys
+import locale
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+import psycopg2
+from dotenv import load_dotenv
+import os
+import time
+import logging
+from normalize import parse_price, parse_area, parse_rooms, parse_item_id, content_hash
+from writer import BatchWriter
+from drivers import BROWSER_PROFILE, apply_lean_options, block_resources, resolve_driver_path
+from listings import ListingExtractor
+from seen import SeenCache
+from history import HISTORY_RETURNING, history_hook, upsert_conflict
+from alerts import alerts_hook
+from invalidation import generation_hook
+from market_stats import market_stats_flush, market_stats_hook
+from captcha import CaptchaDetected, manual_solving_enabled
+from sources import load_sources
+from address import PlaceLookup, parse_address
+from pacing import HostLimiter, ITEM_SELECTOR, PAGE_TIMEOUT, wait_images, wait_items_stable, wait_ready
+
+# Настройка кодировки
+locale.setlocale(locale.LC_ALL, 'ru_RU.UTF-8')
+sys.stdout.reconfigure(encoding='utf-8')
+
+# Настройка логгирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('parser.log', encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Загрузка переменных из .env
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "database": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "port": os.getenv("DB_PORT", "5433"),
+    "client_encoding": "utf8"
+}
+
+# Каталог для сохранения HTML страниц выдачи (для бенчмарков и отладки разбора)
+SNAPSHOT_DIR = os.getenv("PARSER_SNAPSHOT_DIR")
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
+
+
+def is_captcha(html):
+    return any(word in html.lower() for word in ["captcha", "капча"])
+
+
+def setup_driver(profile=None):
+    profile = profile or BROWSER_PROFILE
+    options = Options()
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--disable-infobars")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--lang=ru-RU")
+
+    options.add_argument(f"user-agent={USER_AGENT}")
+
+    if profile == "lean":
+        apply_lean_options(options)
+    else:
+        # Для отладки: полный браузер в окне (BROWSER_PROFILE=debug)
+        options.add_argument("--window-size=1920,1080")
+
+    service = Service(resolve_driver_path())
+    driver = webdriver.Chrome(service=service, options=options)
+
+    if profile == "lean":
+        block_resources(driver)
+
+    # Изменяем свойства navigator.webdriver
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+    return driver
+
+
+# Общий на процесс лимит частоты запросов к сайту
+HOST_LIMITER = HostLimiter()
+
+
+def connect_db():
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        conn.set_client_encoding('UTF8')
+        logger.info("Успешное подключение к БД")
+        return conn
+    except Exception as e:
+        logger.error(f"Ошибка подключения к БД: {str(e)}")
+        raise
+
+
+RENTAL_COLUMNS = ("address", "price", "rooms", "area", "link",
+                  "price_rub", "area_m2", "rooms_n", "avito_id", "content_hash", "city",
+                  "street", "house", "district_id", "metro_id")
+SALE_COLUMNS = ("address", "property_type", "price", "rooms", "area", "link",
+                "price_rub", "area_m2", "rooms_n", "avito_id", "content_hash", "city",
+                "street", "house", "district_id", "metro_id")
+
+# Районы и станции метро: id из geo_places, кэш на процесс
+PLACES = PlaceLookup(connect_db)
+
+
+def address_columns(address, city):
+    # street, house, district_id, metro_id для строки объявления
+    place = parse_address(address, city)
+    return (
+        place.street,
+        place.house,
+        PLACES.resolve(city, "district", place.district),
+        PLACES.resolve(city, "metro", place.metro)
+    )
+
+
+# Объявление однозначно определяется id Avito из ссылки; при повторном
+# обходе строка обновляется и попадает в историю, только если изменилась.
+# В кэш просмотренных id строка попадает только после commit.
+def rental_writer(conn):
+    return BatchWriter(conn, "rental", RENTAL_COLUMNS, upsert_conflict("rental", RENTAL_COLUMNS),
+                       returning=HISTORY_RETURNING.format(table="rental", property_type="NULL::varchar"),
+                       hooks=[history_hook("rent"), alerts_hook("rent"), market_stats_hook("rent"),
+                              generation_hook("rental")],
+                       key="avito_id", committed=[SEEN_TABLES["rent"].committed_hook(RENTAL_COLUMNS)],
+                       on_close=[market_stats_flush("rent")])
+
+
+def sale_writer(conn):
+    return BatchWriter(conn, "sale", SALE_COLUMNS, upsert_conflict("sale", SALE_COLUMNS),
+                       returning=HISTORY_RETURNING.format(table="sale", property_type="property_type"),
+                       hooks=[history_hook("sale"), alerts_hook("sale"), market_stats_hook("sale"),
+                              generation_hook("sale")],
+                       key="avito_id", committed=[SEEN_TABLES["sale"].committed_hook(SALE_COLUMNS)],
+                       on_close=[market_stats_flush("sale")])
+
+
+def rental_row(address, price, rooms, area, link, city=None):
+    avito_id = parse_item_id(link)
+    if avito_id is None:
+        logger.warning(f"Не удалось определить id объявления: {link}")
+        return None
+    return (
+        address, price, rooms, area, link,
+        parse_price(price),
+        parse_area(area),
+        parse_rooms(rooms),
+        avito_id,
+        content_hash(address, price, rooms, area),
+        city
+    ) + address_columns(address, city)
+
+
+def sale_row(address, property_type, price, rooms, area, link, city=None):
+    avito_id = parse_item_id(link)
+    if avito_id is None:
+        logger.warning(f"Не удалось определить id объявления: {link}")
+        return None
+    return (
+        address, property_type, price, rooms, area, link,
+        parse_price(price),
+        parse_area(area),
+        parse_rooms(rooms),
+        avito_id,
+        content_hash(address, price, rooms, area, property_type),
+        city
+    ) + address_columns(address, city)
+
+
+def solve_captcha_manually(driver):
+    logger.warning("Обнаружена капча. Решите её вручную в браузере...")
+    input("После решения капчи нажмите Enter в консоли...")
+    # После решения капчи обновляем страницу
+    driver.refresh()
+    time.sleep(5)
+    return True
+
+
+def page_url(url, page):
+    # Первая страница выдачи — исходный URL, дальше параметр &p=N
+    if page <= 1:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}p={page}"
+
+
+def save_snapshot(html, name):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, f"{os.path.splitext(name)[0]}_{int(time.time())}.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    logger.info(f"HTML страницы сохранен как {path}")
+
+
+def fetch_page(driver, url, timer, screenshot_name="debug_screenshot.png", limiter=None):
+    # Загружает страницу выдачи и возвращает её HTML (или None, если
+    # объявлений нет). Вместо фиксированных пауз ждём конкретных состояний
+    # страницы, а частоту запросов к сайту ограничивает общий HostLimiter.
+    with timer.phase("politeness"):
+        (limiter or HOST_LIMITER).wait(url)
+
+    logger.info(f"Открываем страницу {url}")
+    with timer.phase("navigate"):
+        driver.get(url)
+        wait_ready(driver)
+
+    # Проверка на капчу
+    if is_captcha(driver.page_source):
+        # Без терминала страница откладывается вызывающим кодом, процесс не ждёт
+        if not manual_solving_enabled():
+            raise CaptchaDetected(url)
+        if not solve_captcha_manually(driver):
+            return None
+
+    # Ожидание загрузки объявлений (новый селектор)
+    with timer.phase("items"):
+        try:
+            WebDriverWait(driver, PAGE_TIMEOUT).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, ITEM_SELECTOR)))
+        except TimeoutException:
+            logger.warning("Не удалось найти объявления на странице")
+            return None
+
+    # Прокрутка страницы для имитации поведения пользователя: после
+    # каждого шага ждём, пока подгрузка карточек не прекратится
+    with timer.phase("scroll"):
+        for i in range(3):
+            scroll_height = driver.execute_script("return document.body.scrollHeight")
+            scroll_point = scroll_height * (i + 1) / 4
+            driver.execute_script(f"window.scrollTo(0, {scroll_point});")
+            wait_items_stable(driver, timeout=5)
+
+    with timer.phase("images"):
+        wait_images(driver, timeout=5)
+
+    html = driver.page_source
+    if SNAPSHOT_DIR:
+        save_snapshot(html, screenshot_name)
+    return html
+
+
+def listing_row(listing):
+    # Нормализованная строка для writer'а таблицы объявления (None без id)
+    if listing.deal == "sale":
+        return sale_row(listing.address, listing.property_type, listing.price,
+                        listing.rooms, listing.area, listing.link, listing.city)
+    return rental_row(listing.address, listing.price, listing.rooms, listing.area, listing.link, listing.city)
+
+
+WRITERS = {"rent": rental_writer, "sale": sale_writer}
+
+# Источники из sources.yaml (город × сделка × категория)
+SOURCES = load_sources()
+
+# Категории выдачи: стартовый URL, фабрика writer'а и разбор карточек
+CATEGORIES = {
+    name: (source.url, WRITERS[source.deal], ListingExtractor(source.deal, city=source.city))
+    for name, source in SOURCES.items()
+}
+
+# id уже сохранённых объявлений: кэш общий для всех источников одной таблицы
+SEEN_TABLES = {"rent": SeenCache("rental"), "sale": SeenCache("sale")}
+SEEN = {name: SEEN_TABLES[source.deal] for name, source in SOURCES.items()}
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import socket
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд страница в running считается брошенной (процесс упал)
+CRAWL_LEASE = int(os.getenv("CRAWL_QUEUE_LEASE", "600"))
+CRAWL_MAX_ATTEMPTS = int(os.getenv("CRAWL_QUEUE_MAX_ATTEMPTS", "3"))
+
+
+def worker_name(n):
+    return f"{socket.gethostname()}:{os.getpid()}:{n}"
+
+
+class CrawlQueue:
+    # Очередь страниц обхода в таблице crawl_queue. Несколько процессов
+    # на разных машинах забирают страницы через FOR UPDATE SKIP LOCKED и
+    # не пересекаются. Соединение отдельное от writer'ов и в autocommit:
+    # статус страницы фиксируется сразу, независимо от батчей объявлений.
+
+    def __init__(self, conn, worker, lease=CRAWL_LEASE, max_attempts=CRAWL_MAX_ATTEMPTS):
+        self.conn = conn
+        self.conn.autocommit = True
+        self.worker = worker
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    def enqueue(self, source, pages, page_url):
+        with self.conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO crawl_queue (source, page, url) VALUES %s
+                ON CONFLICT (source, page) WHERE status IN ('pending', 'running') DO NOTHING
+                RETURNING id
+            """, [(source.name, page, page_url(source.url, page)) for page in range(1, pages + 1)], fetch=True)
+        logger.info(f"В очередь обхода {source.name}: добавлено страниц {len(rows)} из {pages}")
+        return len(rows)
+
+    def claim(self, sources):
+        # (id, source, page, attempts) или None, если забирать нечего.
+        # Процесс берёт только источники, которые у него настроены.
+        # Брошенная страница (аренда истекла) забирается повторно, пока не
+        # исчерпаны попытки, — иначе она помечается failed, как в retry():
+        # страница, которая роняет обработчик, не должна ходить по кругу.
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE crawl_queue
+                SET status = 'failed', error = 'аренда истекла', locked_by = NULL, finished_at = CURRENT_TIMESTAMP
+                WHERE source = ANY(%s) AND status = 'running' AND attempts >= %s
+                  AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                RETURNING id, attempts
+            """, (list(sources), self.max_attempts, self.lease))
+            for task_id, attempts in cur.fetchall():
+                logger.error(f"Страница {task_id} очереди обхода не обработана после {attempts} попыток: "
+                             f"аренда истекла")
+            cur.execute("""
+                UPDATE crawl_queue
+                SET status = 'running', locked_by = %s, locked_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM crawl_queue
+                    WHERE source = ANY(%s)
+                      AND ((status = 'pending' AND not_before <= CURRENT_TIMESTAMP)
+                        OR (status = 'running' AND attempts < %s
+                            AND locked_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'))
+                    ORDER BY not_before, id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, source, page, attempts
+            """, (self.worker, list(sources), self.max_attempts, self.lease))
+            row = cur.fetchone()
+        return row
+
+    def complete(self, task_id, items=0, listed=0):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE crawl_queue
+                SET status = 'done', finished_at = CURRENT_TIMESTAMP, items = %s, listed = %s, error = NULL
+                WHERE id = %s
+            """, (items, listed, task_id))
+
+    def retry(self, task_id, attempts, error, delay):
+        # Вернуть страницу в очередь не раньше чем через delay секунд;
+        # после max_attempts попыток страница помечается failed
+        status = "failed" if attempts >= self.max_attempts else "pending"
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE crawl_queue
+                SET status = %s, error = %s, locked_by = NULL,
+                    not_before = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+                    finished_at = CASE WHEN %s = 'failed' THEN CURRENT_TIMESTAMP END
+                WHERE id = %s
+            """, (status, error, delay, status, task_id))
+        if status == "failed":
+            logger.error(f"Страница {task_id} очереди обхода не обработана после {attempts} попыток: {error}")
+        return status == "pending"
+
+    def skip_after(self, source, page):
+        # Дальше первой полностью знакомой страницы идут более старые
+        # объявления — ожидающие страницы источника закрываются без обхода
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE crawl_queue SET status = 'done', finished_at = CURRENT_TIMESTAMP, items = 0
+                WHERE source = %s AND page > %s AND status = 'pending'
+            """, (source, page))
+            return cur.rowcount
+
+    def fresh_rate(self, source, since):
+        # Доля новых объявлений по страницам источника, обойдённым после since
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT SUM(items)::float / NULLIF(SUM(listed), 0) FROM crawl_queue
+                WHERE source = %s AND status = 'done' AND finished_at > %s
+            """, (source, since))
+            return cur.fetchone()[0]
+
+    def now(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT CURRENT_TIMESTAMP")
+            return cur.fetchone()[0]
+
+    def close(self):
+        self.conn.close()
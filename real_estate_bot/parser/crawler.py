@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+
+from captcha import CaptchaDetected, CaptchaQueue
+from crawl_queue import CrawlQueue, worker_name
+from drivers import DriverManager
+from metrics import PAGES
+from pacing import HostLimiter, PhaseTimer, TIMINGS
+from http_fetch import HttpFetcher, HTTP_CONCURRENCY
+from common import CATEGORIES, USER_AGENT, connect_db, fetch_page, is_captcha, page_url, setup_driver
+from pipeline import IngestPipeline
+
+logger = logging.getLogger(__name__)
+
+# Пауза между опросами пустой общей очереди в режиме follow, сек
+CRAWL_QUEUE_POLL = float(os.getenv("CRAWL_QUEUE_POLL", "5"))
+
+
+class Crawler:
+    # Обход нескольких страниц выдачи по нескольким категориям.
+    # Страницы раздаются из общей очереди пулу потоков; браузеры берутся
+    # из пула прогретых сессий. Загруженный HTML уходит в IngestPipeline,
+    # который разбирает и пишет объявления, пока браузеры грузят дальше.
+    # В режиме http страницы сначала загружаются без браузера, а в очередь
+    # браузеров попадают только те, где капча или выдача рисуется скриптом.
+    # В режиме shared страницы берутся из таблицы crawl_queue, общей для
+    # нескольких процессов и машин.
+
+    def __init__(self, categories, pages, workers=2, page_interval=15.0, drivers=None, http=False, limiter=None,
+                 shared=False, follow=False):
+        self.categories = categories
+        self.pages = pages
+        self.workers = workers
+        self.page_interval = page_interval
+        # Интервал задан на браузер; к сайту все браузеры вместе ходят
+        # через одно ведро токенов в workers раз чаще
+        self.limiter = limiter or HostLimiter(page_interval / max(workers, 1))
+        self.http = http
+        self.shared = shared
+        self.follow = follow
+        self.own_drivers = drivers is None
+        self.drivers = drivers or DriverManager(setup_driver, size=workers)
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {"pages": 0, "items": 0, "empty": 0, "skipped": 0, "listed": 0, "http_pages": 0, "browser_fallback": 0}
+        # Номер первой полностью знакомой страницы по категориям: дальше
+        # по выдаче идут ещё более старые объявления, их не обходим
+        self.exhausted = {}
+        self.captchas = CaptchaQueue()
+        self.pipeline = None
+        # Итоги страниц общей очереди отмечаются из потока записи конвейера
+        self.completions = None
+
+    def fill_queue(self):
+        # Страницы категорий чередуются, чтобы нагрузка ложилась на оба раздела
+        for page in range(1, self.pages + 1):
+            for category in self.categories:
+                self.tasks.put((category, page))
+
+    def next_task(self):
+        # Сначала обычные страницы, затем отложенные после капчи, у которых
+        # вышла пауза. Если остались только отложенные — ждём ближайшую.
+        while True:
+            try:
+                return self.tasks.get_nowait()
+            except queue.Empty:
+                pass
+            task = self.captchas.pop_due()
+            if task is not None:
+                return task
+            wait = self.captchas.next_due()
+            if wait is None:
+                return None
+            time.sleep(min(wait, 5.0))
+
+    def run(self):
+        self.pipeline = IngestPipeline().start()
+        if self.shared:
+            # страницы в crawl_queue ставит parser.py --enqueue или планировщик
+            self.completions = CrawlQueue(connect_db(), worker_name("pipeline"))
+        elif self.http:
+            asyncio.run(self.crawl_http())
+        else:
+            self.fill_queue()
+        threads = [
+            threading.Thread(target=self.worker, args=(n,), name=f"crawler-{n}", daemon=True)
+            for n in range(self.workers if self.shared else min(self.workers, self.tasks.qsize()))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.own_drivers:
+            self.drivers.close()
+        # Дожидаемся разбора и записи всего, что уже загружено
+        self.pipeline.close()
+        if self.completions:
+            self.completions.close()
+
+        logger.info(f"Обход завершен: страниц {self.stats['pages']}, новых объявлений {self.stats['items']}, "
+                    f"пустых страниц {self.stats['empty']}, пропущено страниц {self.stats['skipped']}")
+        captchas = self.captchas.metrics()
+        for worker, stats in captchas["workers"].items():
+            logger.info(f"[{worker}] капча на {stats['captchas']} из {stats['pages']} страниц ({stats['rate']:.0%})")
+        if captchas["abandoned"]:
+            logger.warning(f"Брошено страниц из-за капчи: {captchas['abandoned']}")
+        self.stats["captcha"] = captchas
+        TIMINGS.log()
+        self.stats["timings"] = TIMINGS.summary()
+        return self.stats
+
+    def worker(self, n):
+        shared = None
+        try:
+            if self.shared:
+                shared = CrawlQueue(connect_db(), worker_name(n))
+            while True:
+                task = self.claim(shared) if shared else self.next_task()
+                if task is None:
+                    break
+                category, page = task[1:3] if shared else task
+
+                if not shared:
+                    with self.lock:
+                        if page > self.exhausted.get(category, page):
+                            self.stats["skipped"] += 1
+                            continue
+
+                on_done = self.page_done(category, page, n, task[0] if shared else None)
+                try:
+                    loaded = self.crawl_page(category, page, on_done)
+                    self.captchas.record(n)
+                except CaptchaDetected:
+                    self.captchas.record(n, captcha=True)
+                    PAGES.labels(category, "browser", "captcha").inc()
+                    if shared:
+                        shared.retry(task[0], task[3], "captcha", self.captchas.delay(task[3]))
+                    else:
+                        self.captchas.park(task)
+                    continue
+                except Exception as e:
+                    logger.error(f"[{n}] Ошибка обработки страницы {category} #{page}: {str(e)}",
+                                 exc_info=True)
+                    PAGES.labels(category, "browser", "error").inc()
+                    if shared:
+                        shared.retry(task[0], task[3], str(e), self.captchas.delay(task[3]))
+                    else:
+                        on_done(0, 0)
+                    continue
+
+                PAGES.labels(category, "browser", "ok" if loaded else "empty").inc()
+                if not loaded:
+                    on_done(0, 0)
+        except Exception as e:
+            logger.error(f"[{n}] Ошибка потока обхода: {str(e)}", exc_info=True)
+        finally:
+            try:
+                if shared:
+                    shared.close()
+            except Exception as e:
+                logger.error(f"[{n}] Ошибка при закрытии соединения с БД: {str(e)}")
+
+    def claim(self, shared):
+        # Следующая страница общей очереди; с follow ждём новых страниц
+        while True:
+            task = shared.claim(self.categories)
+            if task is not None or not self.follow:
+                return task
+            time.sleep(CRAWL_QUEUE_POLL)
+
+    def crawl_page(self, category, page, on_done):
+        # False — объявлений на странице нет
+        url = CATEGORIES[category][0]
+        timer = PhaseTimer()
+        try:
+            with self.drivers.session() as session:
+                try:
+                    html = fetch_page(session.driver, page_url(url, page), timer, f"debug_{category}_{page}.png",
+                                      self.limiter)
+                except CaptchaDetected:
+                    # Браузер с капчей не возвращается в пул: повтор пойдёт в новом
+                    session.discard = True
+                    raise
+                session.pages += 1
+        finally:
+            TIMINGS.add(timer)
+            logger.info(f"Страница за {timer.total():.1f} с: {timer}")
+        if html is None:
+            return False
+        self.pipeline.submit(category, page, html, on_done)
+        return True
+
+    def page_done(self, category, page, n, task_id=None):
+        # Итог страницы после отсева известных объявлений
+        def done(count, listed):
+            exhausted = listed and not count
+            with self.lock:
+                self.stats["pages"] += 1
+                self.stats["items"] += count
+                self.stats["listed"] += listed
+                if not count:
+                    self.stats["empty"] += 1
+                if exhausted:
+                    self.exhausted[category] = min(page, self.exhausted.get(category, page))
+            if exhausted:
+                logger.info(f"[{n}] {category} #{page}: все объявления уже известны, дальше не идём")
+            elif listed:
+                logger.info(f"[{n}] {category} #{page}: новых объявлений {count}/{listed}")
+
+            if task_id is not None:
+                self.completions.complete(task_id, count, listed)
+                if exhausted:
+                    skipped = self.completions.skip_after(category, page)
+                    with self.lock:
+                        self.stats["skipped"] += skipped
+        return done
+
+    async def crawl_http(self):
+        # Страницы загружаются окнами по HTTP_CONCURRENCY на категорию: так
+        # остановка на полностью знакомой странице срабатывает без лишних запросов.
+        # submit блокируется при обратном давлении конвейера, поэтому уходит
+        # в поток, а не останавливает цикл событий с остальными загрузками.
+        # stats и exhausted меняются и из потока записи конвейера — под self.lock.
+        loop = asyncio.get_running_loop()
+        async with HttpFetcher(USER_AGENT) as fetcher:
+            for start in range(1, self.pages + 1, HTTP_CONCURRENCY):
+                with self.lock:
+                    batch = [
+                        (category, page)
+                        for category in self.categories
+                        if category not in self.exhausted
+                        for page in range(start, min(start + HTTP_CONCURRENCY, self.pages + 1))
+                    ]
+                if not batch:
+                    break
+                pages = await fetcher.fetch_all(
+                    [page_url(CATEGORIES[category][0], page) for category, page in batch])
+
+                for (category, page), html in zip(batch, pages):
+                    with self.lock:
+                        skip = page > self.exhausted.get(category, page)
+                        if skip:
+                            self.stats["skipped"] += 1
+                    if skip:
+                        continue
+                    result = "error"
+                    if html:
+                        captcha = is_captcha(html)
+                        self.captchas.record("http", captcha)
+                        result = "captcha" if captcha else "ok" if server_rendered(html) else "empty"
+                    PAGES.labels(category, "http", result).inc()
+                    if result != "ok":
+                        # Капча, ошибка или объявления подгружаются скриптом
+                        with self.lock:
+                            self.stats["browser_fallback"] += 1
+                        self.tasks.put((category, page))
+                        continue
+                    with self.lock:
+                        self.stats["http_pages"] += 1
+                    await loop.run_in_executor(None, self.pipeline.submit, category, page, html,
+                                               self.page_done(category, page, "http"))
+                # Окно страниц больше не нужно, пока ждём следующее
+                pages = html = None
+        with self.lock:
+            http_pages, fallback = self.stats["http_pages"], self.stats["browser_fallback"]
+        logger.info(f"HTTP: загружено страниц {http_pages}, передано браузеру {fallback}")
+
+
+def server_rendered(html):
+    # Карточки пришли в HTML сервера, а не дорисовываются скриптом
+    return 'data-marker="item"' in html or 'itemprop="itemListElement"' in html
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from webdriver_manager.chrome import ChromeDriverManager
+
+logger = logging.getLogger(__name__)
+
+DRIVER_PATH_CACHE = os.getenv(
+    "CHROMEDRIVER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "real_estate_bot", "chromedriver.json"))
+DRIVER_PATH_TTL = float(os.getenv("CHROMEDRIVER_CACHE_TTL", str(24 * 3600)))
+
+MAX_PAGES_PER_SESSION = int(os.getenv("DRIVER_MAX_PAGES", "50"))
+MAX_HEAP_MB = float(os.getenv("DRIVER_MAX_HEAP_MB", "512"))
+
+# lean — headless без картинок, шрифтов и счётчиков для обхода;
+# debug — полный браузер в окне, как раньше, для отладки
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "lean")
+RENDERER_PROCESS_LIMIT = os.getenv("BROWSER_RENDERER_LIMIT", "2")
+
+# Шаблоны URL для Network.setBlockedURLs: медиа, шрифты, реклама и аналитика
+BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.m3u8",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*mc.yandex.ru*", "*an.yandex.ru*", "*yandex.ru/ads*", "*ads.adfox.ru*",
+    "*top-fwz1.mail.ru*", "*vk.com/rtrg*", "*criteo*", "*hotjar*",
+] + [url.strip() for url in os.getenv("BROWSER_BLOCK_URLS", "").split(",") if url.strip()]
+
+_path_lock = threading.Lock()
+
+
+def resolve_driver_path():
+    # ChromeDriverManager().install() при каждом вызове ходит в сеть за
+    # последней версией драйвера. Путь кэшируется на диске на сутки.
+    explicit = os.getenv("CHROMEDRIVER_PATH")
+    if explicit:
+        return explicit
+
+    with _path_lock:
+        try:
+            with open(DRIVER_PATH_CACHE, encoding="utf-8") as f:
+                cached = json.load(f)
+            if (os.path.exists(cached["path"]) and
+                    time.time() - cached["resolved_at"] < DRIVER_PATH_TTL):
+                return cached["path"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        path = ChromeDriverManager().install()
+        try:
+            os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+            with open(DRIVER_PATH_CACHE, "w", encoding="utf-8") as f:
+                json.dump({"path": path, "resolved_at": time.time()}, f)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить путь к драйверу: {str(e)}")
+        return path
+
+
+def apply_lean_options(options):
+    options.add_argument("--headless=new")
+    options.add_argument("--window-size=1024,768")
+    options.add_argument(f"--renderer-process-limit={RENDERER_PROCESS_LIMIT}")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--mute-audio")
+    options.add_argument("--disable-background-networking")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.fonts": 2,
+    })
+
+
+def block_resources(driver):
+    # Блокировка на уровне сети: запросы к этим URL не уходят вовсе
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+
+
+class WarmSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.started_at = time.monotonic()
+        # Сессию нельзя возвращать в пул (например, на ней показали капчу)
+        self.discard = False
+
+
+class DriverManager:
+    # Держит прогретые сессии браузера между циклами парсинга.
+    # Перед выдачей сессия проверяется, после N страниц или роста
+    # JS-heap выше порога — пересоздаётся.
+
+    def __init__(self, factory, size=1, max_pages=MAX_PAGES_PER_SESSION, max_heap_mb=MAX_HEAP_MB):
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_heap_mb = max_heap_mb
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.closed = False
+
+    def _start(self):
+        started = time.monotonic()
+        session = WarmSession(self.factory())
+        with self.lock:
+            self.sessions.append(session)
+        logger.info(f"Запущен браузер за {time.monotonic() - started:.1f} с")
+        return session
+
+    def _stop(self, session):
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+        try:
+            session.driver.quit()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии драйвера: {str(e)}")
+
+    def _healthy(self, session):
+        try:
+            return session.driver.execute_script("return 1") == 1
+        except Exception as e:
+            logger.warning(f"Сессия браузера не отвечает: {str(e)}")
+            return False
+
+    def _heap_mb(self, session):
+        try:
+            used = session.driver.execute_script(
+                "return window.performance && performance.memory ? performance.memory.usedJSHeapSize : 0")
+            return (used or 0) / (1024 * 1024)
+        except Exception:
+            return 0
+
+    def _worn_out(self, session):
+        if session.pages >= self.max_pages:
+            logger.info(f"Перезапуск браузера после {session.pages} страниц")
+            return True
+        heap = self._heap_mb(session)
+        if heap > self.max_heap_mb:
+            logger.info(f"Перезапуск браузера: JS heap {heap:.0f} МБ")
+            return True
+        return False
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    session = self.idle.get_nowait()
+                except queue.Empty:
+                    return self._start()
+                if self._healthy(session):
+                    return session
+                self._stop(session)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, session, broken=False):
+        try:
+            if broken or session.discard or self.closed or self._worn_out(session):
+                self._stop(session)
+            else:
+                self.idle.put(session)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def session(self):
+        session = self.acquire()
+        broken = False
+        try:
+            yield session
+        except Exception:
+            broken = not self._healthy(session)
+            raise
+        finally:
+            self.release(session, broken)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self._stop(self.idle.get_nowait())
+            except queue.Empty:
+                break
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+
+from metrics import SELECTOR_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Запасные селекторы полей карточки в порядке приоритета:
+# (тег, атрибут, значение). Для class значение ищется в списке классов.
+ITEM_SELECTORS = [("div", "data-marker", "item"), ("div", "itemprop", "itemListElement")]
+
+FIELD_SELECTORS = {
+    "link": [("a", "data-marker", "item-title"), ("a", "itemprop", "url")],
+    "title": [("h3", "itemprop", "name"), ("h3", "class", "title-root"), ("a", "data-marker", "item-title")],
+    "price": [("meta", "itemprop", "price"), ("span", "data-marker", "item-price"), ("span", "itemprop", "price")],
+    "address": [("div", "data-marker", "item-address"), ("span", "class", "geo-address"), ("div", "class", "geo-root")],
+    "description": [("div", "class", "iva-item-description")],
+}
+
+
+def compile_selectors(fields):
+    # Селекторы группируются по тегу один раз, чтобы каждый узел карточки
+    # проверялся только против правил своего тега
+    by_tag = {}
+    for field, rules in fields.items():
+        for priority, (tag, attr, value) in enumerate(rules):
+            by_tag.setdefault(tag, []).append((field, priority, attr, value))
+    return by_tag
+
+
+COMPILED_FIELDS = compile_selectors(FIELD_SELECTORS)
+# Описание есть не у всех карточек, его отсутствие не считается сбоем разбора
+REQUIRED_FIELDS = [field for field in FIELD_SELECTORS if field != "description"]
+
+
+def _matches(attr_value, attr, value):
+    if attr_value is None:
+        return False
+    if attr == "class":
+        classes = attr_value if isinstance(attr_value, (list, tuple)) else attr_value.split()
+        return value in classes
+    return attr_value == value
+
+
+class BaseBackend:
+    name = "base"
+
+    def parse(self, html):
+        raise NotImplementedError
+
+    def items(self, root):
+        raise NotImplementedError
+
+    def descendants(self, item):
+        # (тег, узел) для всех элементов внутри карточки
+        raise NotImplementedError
+
+    def attr(self, node, name):
+        raise NotImplementedError
+
+    def text(self, node):
+        raise NotImplementedError
+
+    def extract(self, html):
+        return list(self.iter_extract(html))
+
+    def iter_extract(self, html):
+        # Карточки по одной: дерево страницы живёт, пока не исчерпан генератор
+        root = self.parse(html)
+        for item in self.items(root):
+            yield self.extract_item(item)
+
+    def extract_item(self, item):
+        # Один проход по узлам карточки: для каждого поля запоминается
+        # узел с наилучшим (наименьшим) приоритетом селектора
+        found = {}
+        for tag, node in self.descendants(item):
+            rules = COMPILED_FIELDS.get(tag)
+            if not rules:
+                continue
+            for field, priority, attr, value in rules:
+                best = found.get(field)
+                if best is not None and best[0] <= priority:
+                    continue
+                if _matches(self.attr(node, attr), attr, value):
+                    found[field] = (priority, tag, node)
+
+        for field in REQUIRED_FIELDS:
+            best = found.get(field)
+            if best is None:
+                SELECTOR_FALLBACKS.labels(field, "missing").inc()
+            elif best[0]:
+                SELECTOR_FALLBACKS.labels(field, str(best[0])).inc()
+
+        card = {}
+        link = found.get("link")
+        href = self.attr(link[2], "href") if link else None
+        card["link"] = "https://www.avito.ru" + href if href else None
+
+        title = found.get("title")
+        card["title"] = self.text(title[2]) if title else None
+
+        price = found.get("price")
+        if not price:
+            card["price"] = None
+        elif price[1] == "meta":
+            content = self.attr(price[2], "content")
+            card["price"] = f"{content} ₽" if content else "0 ₽"
+        else:
+            card["price"] = self.text(price[2])
+            if '₽' not in card["price"]:
+                card["price"] += " ₽"
+
+        address = found.get("address")
+        card["address"] = self.text(address[2]) if address else None
+
+        description = found.get("description")
+        card["description"] = self.text(description[2]) if description else ""
+        return card
+
+
+class SoupBackend(BaseBackend):
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup, Tag
+        self.BeautifulSoup = BeautifulSoup
+        self.Tag = Tag
+
+    def parse(self, html):
+        return self.BeautifulSoup(html, 'html.parser')
+
+    def items(self, root):
+        for tag, attr, value in ITEM_SELECTORS:
+            items = root.find_all(tag, {attr: value})
+            if items:
+                return items
+        return []
+
+    def descendants(self, item):
+        for node in item.descendants:
+            if isinstance(node, self.Tag):
+                yield node.name, node
+
+    def attr(self, node, name):
+        return node.get(name)
+
+    def text(self, node):
+        return node.get_text(strip=True)
+
+
+class LxmlBackend(BaseBackend):
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        self.lxml_html = lxml.html
+
+    def parse(self, html):
+        return self.lxml_html.fromstring(html)
+
+    def items(self, root):
+        for tag, attr, value in ITEM_SELECTORS:
+            items = root.xpath(f'//{tag}[@{attr}="{value}"]')
+            if items:
+                return items
+        return []
+
+    def descendants(self, item):
+        for node in item.iterdescendants():
+            if isinstance(node.tag, str):
+                yield node.tag, node
+
+    def attr(self, node, name):
+        return node.get(name)
+
+    def text(self, node):
+        return "".join(part.strip() for part in node.itertext())
+
+
+class SelectolaxBackend(BaseBackend):
+    name = "selectolax"
+
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser
+        except ImportError:
+            from selectolax.parser import HTMLParser
+        self.HTMLParser = HTMLParser
+
+    def parse(self, html):
+        return self.HTMLParser(html)
+
+    def items(self, root):
+        for tag, attr, value in ITEM_SELECTORS:
+            items = root.css(f'{tag}[{attr}="{value}"]')
+            if items:
+                return items
+        return []
+
+    def descendants(self, item):
+        nodes = item.traverse(include_text=False)
+        next(nodes, None)  # сама карточка
+        for node in nodes:
+            yield node.tag, node
+
+    def attr(self, node, name):
+        return node.attributes.get(name)
+
+    def text(self, node):
+        return node.text(deep=True, separator="", strip=True)
+
+
+BACKENDS = {
+    "selectolax": SelectolaxBackend,
+    "lxml": LxmlBackend,
+    "bs4": SoupBackend,
+}
+
+
+def get_backend(name=None):
+    # Берём самый быстрый доступный бэкенд; BeautifulSoup — запасной вариант
+    names = [name] if name else list(BACKENDS)
+    for candidate in names:
+        try:
+            return BACKENDS[candidate]()
+        except ImportError:
+            logger.info(f"Бэкенд разбора {candidate} недоступен")
+    return SoupBackend()
+
+
+BACKEND = get_backend(os.getenv("PARSER_HTML_BACKEND") or None)
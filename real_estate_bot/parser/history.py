@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Колонки, которые upsert возвращает для изменившихся объявлений. Последние
+# три — комнаты, город и район до изменения (NULL для новых): подзапрос в
+# RETURNING видит таблицу такой, какой она была до этого INSERT.
+HISTORY_RETURNING = ("avito_id, content_hash, price, price_rub, area_m2, rooms_n, address, {property_type}, "
+                     "(xmax = 0) AS inserted, link, city, district_id, "
+                     "(SELECT o.rooms_n FROM {table} o WHERE o.avito_id = {table}.avito_id) AS old_rooms_n, "
+                     "(SELECT o.city FROM {table} o WHERE o.avito_id = {table}.avito_id) AS old_city, "
+                     "(SELECT o.district_id FROM {table} o WHERE o.avito_id = {table}.avito_id) AS old_district_id")
+
+
+def upsert_conflict(table, columns):
+    # Строка обновляется, только если поменялся хэш содержимого; для
+    # неизменившихся объявлений UPDATE не выполняется и RETURNING пуст
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column != "avito_id")
+    return (f"ON CONFLICT (avito_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP "
+            f"WHERE {table}.content_hash IS DISTINCT FROM EXCLUDED.content_hash")
+
+
+def history_hook(deal):
+    # Для каждой новой или изменившейся строки — запись в listing_history
+    def record(cur, returned):
+        if not returned:
+            return
+        execute_values(cur, """
+            INSERT INTO listing_history
+                (deal, avito_id, content_hash, price, price_rub, area_m2, rooms_n, address, property_type)
+            VALUES %s
+        """, [(deal,) + tuple(row[:8]) for row in returned], page_size=len(returned))
+        updated = sum(1 for row in returned if not row[8])
+        if updated:
+            logger.info(f"Изменилось объявлений ({deal}): {updated}")
+    return record
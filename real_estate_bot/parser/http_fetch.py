@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import os
+import random
+
+import aiohttp
+
+from pacing import HostLimiter
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONCURRENCY = int(os.getenv("HTTP_CONCURRENCY", "4"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "20"))
+# Небольшой случайный разброс между запросами одного слота
+HTTP_JITTER = float(os.getenv("HTTP_JITTER", "1.0"))
+# Запросы без браузера легче, им достаточно своего, более частого лимита
+HTTP_HOST_INTERVAL = float(os.getenv("HTTP_HOST_INTERVAL", "1.0"))
+
+
+class HttpFetcher:
+    # Загрузка страниц выдачи без браузера: общий пул соединений aiohttp
+    # и не больше concurrency одновременных запросов.
+
+    def __init__(self, user_agent, concurrency=HTTP_CONCURRENCY, timeout=HTTP_TIMEOUT, jitter=HTTP_JITTER,
+                 limiter=None):
+        self.user_agent = user_agent
+        self.limiter = limiter or HostLimiter(HTTP_HOST_INTERVAL, burst=concurrency)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.jitter = jitter
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={
+                "User-Agent": self.user_agent,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "ru-RU,ru;q=0.9",
+            },
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def fetch(self, url):
+        # HTML страницы или None, если её нужно загрузить браузером
+        async with self.semaphore:
+            await self.limiter.wait_async(url)
+            if self.jitter:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+            try:
+                async with self.session.get(url) as response:
+                    if response.status != 200:
+                        logger.info(f"HTTP {response.status} для {url}")
+                        return None
+                    return await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.info(f"Ошибка загрузки {url}: {e!r}")
+                return None
+
+    async def fetch_all(self, urls):
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
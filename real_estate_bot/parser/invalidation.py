@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_generation"
+
+
+def generation_hook(table):
+    # Данные таблицы изменились — увеличиваем её поколение. Кэш веб-приложения
+    # включает поколение в ключ и узнаёт о новом через LISTEN сразу после commit.
+    def bump(cur, returned):
+        if not returned:
+            return
+        cur.execute("""
+            INSERT INTO cache_generation (table_name, generation) VALUES (%s, 1)
+            ON CONFLICT (table_name) DO UPDATE SET generation = cache_generation.generation + 1
+            RETURNING generation
+        """, (table,))
+        generation = cur.fetchone()[0]
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, f"{table}:{generation}"))
+    return bump
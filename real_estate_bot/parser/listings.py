@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import logging
+from dataclasses import dataclass
+
+from extract import BACKEND
+from metrics import ITEMS_PER_PAGE, ITEMS_SKIPPED
+from normalize import parse_item_id, content_hash
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Listing:
+    deal: str  # "rent" или "sale"
+    link: str
+    title: str
+    price: str
+    address: str
+    rooms: str
+    area: str
+    property_type: str = None
+    avito_id: int = None
+    content_hash: int = None
+    city: str = None
+
+
+def parse_title(title):
+    # "2-к. квартира, 54,3 м², 5/9 эт." -> ("2-к. квартира", "54,3")
+    title_parts = [part.strip() for part in title.split(', ')]
+    rooms = title_parts[0]  # Первая часть - комнаты
+    area = next((part for part in title_parts if 'м²' in part), "N/A")
+
+    # Очистка площади (если нужно только число)
+    area_value = area.replace(' м²', '').strip() if area != "N/A" else "N/A"
+    return rooms, area_value
+
+
+def detect_property_type(description):
+    description = description.lower()
+    if 'новостр' in description:
+        return "новостройка"
+    # 'вторич', 'апартамент' и всё остальное считаем вторичкой
+    return "вторичка"
+
+
+class ListingExtractor:
+    # Общий разбор карточек выдачи для аренды и продажи.
+    # Работает и со страницей из браузера, и с сохранённым HTML-файлом.
+
+    def __init__(self, deal, backend=None, city=None):
+        self.deal = deal
+        self.city = city
+        self.backend = backend or BACKEND
+
+    def extract(self, html):
+        return list(self.iter_extract(html))
+
+    def iter_extract(self, html):
+        count = 0
+        skipped = 0
+        for card in self.backend.iter_extract(html):
+            listing = self.build(card)
+            if listing is None:
+                skipped += 1
+            else:
+                count += 1
+                yield listing
+        ITEMS_PER_PAGE.labels(self.deal).observe(count)
+        if skipped:
+            ITEMS_SKIPPED.labels(self.deal).inc(skipped)
+            logger.warning(f"Не все обязательные элементы найдены в {skipped} объявлениях")
+
+    def extract_file(self, path):
+        with open(path, encoding="utf-8") as f:
+            return self.extract(f.read())
+
+    def build(self, card):
+        title = card["title"]
+        if not all([title, card["price"], card["address"]]):
+            return None
+
+        try:
+            rooms, area = parse_title(title)
+        except Exception as e:
+            logger.error(f"Ошибка обработки заголовка: {str(e)}")
+            rooms, area = "N/A", "N/A"
+
+        property_type = detect_property_type(card["description"]) if self.deal == "sale" else None
+        return Listing(self.deal, card["link"], title, card["price"], card["address"], rooms, area,
+                       property_type, parse_item_id(card["link"]),
+                       content_hash(card["address"], card["price"], rooms, area, property_type), self.city)
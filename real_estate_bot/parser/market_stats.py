@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Не чаще чем раз в столько секунд пересчитывается одна группа
+MARKET_STATS_INTERVAL = float(os.getenv("MARKET_STATS_INTERVAL", "60"))
+
+TABLES = {"rent": "rental", "sale": "sale"}
+
+# Процентили 0..100: по ним веб-приложение находит процентиль любой цены за м²
+POINTS = [n / 100 for n in range(101)]
+
+STATS_QUERY = """
+    INSERT INTO market_stats (deal, city, rooms_n, district_id, listings, price_percentiles, ppm2_percentiles,
+                              updated_at)
+    SELECT %(deal)s, %(city)s, %(rooms_n)s, %(district_id)s, COUNT(*),
+           percentile_disc(%(points)s::float8[]) WITHIN GROUP (ORDER BY price_rub),
+           percentile_disc(%(points)s::float8[]) WITHIN GROUP (ORDER BY ROUND(price_rub::numeric / area_m2, 2)),
+           CURRENT_TIMESTAMP
+    FROM {table}
+    WHERE city = %(city)s AND rooms_n = %(rooms_n)s AND price_rub > 0 AND area_m2 > 0{district}
+    ON CONFLICT (deal, city, rooms_n, district_id) DO UPDATE SET
+        listings = EXCLUDED.listings,
+        price_percentiles = EXCLUDED.price_percentiles,
+        ppm2_percentiles = EXCLUDED.ppm2_percentiles,
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+class MarketStats:
+    # Статистика рынка в таблице market_stats: число объявлений и процентили
+    # цены и цены за м² по группам сделка × город × комнаты × район
+    # (district_id = 0 — весь город). Веб-приложение и бот читают готовую
+    # строку по ключу, а не агрегируют всю таблицу на каждый запрос.
+    #
+    # После батча пересчитываются только группы, в которые попали новые или
+    # изменившиеся объявления, и не чаще MARKET_STATS_INTERVAL: остальные
+    # остаются помеченными и пересчитываются со следующим батчем или при
+    # закрытии writer'а (flush). Изменившееся объявление помечает и группу,
+    # в которой было до изменения.
+
+    def __init__(self, deal, interval=MARKET_STATS_INTERVAL):
+        self.deal = deal
+        self.table = TABLES[deal]
+        self.interval = interval
+        self.dirty = set()
+        self.refreshed = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, cur, groups):
+        for city, rooms_n, district_id in groups:
+            query = STATS_QUERY.format(table=self.table,
+                                       district=" AND district_id = %(district_id)s" if district_id else "")
+            cur.execute(query, {"deal": self.deal, "city": city, "rooms_n": rooms_n,
+                                "district_id": district_id, "points": POINTS})
+
+    def mark(self, returned):
+        # Строки RETURNING из HISTORY_RETURNING: rooms_n, город и район после
+        # изменения и до него — объявление уходит из старой группы
+        for row in returned:
+            self._mark(row[5], row[10], row[11])
+            if (row[12], row[13], row[14]) != (row[5], row[10], row[11]):
+                self._mark(row[12], row[13], row[14])
+
+    def _mark(self, rooms_n, city, district_id):
+        if rooms_n is None or not city:
+            return
+        self.dirty.add((city, rooms_n, 0))
+        if district_id:
+            self.dirty.add((city, rooms_n, district_id))
+
+    def _refresh_due(self, cur, due, now):
+        # Вызывается под self.lock. Ошибка статистики не должна откатывать
+        # сохранение объявлений
+        cur.execute("SAVEPOINT market_stats")
+        try:
+            self.refresh(cur, due)
+            cur.execute("RELEASE SAVEPOINT market_stats")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT market_stats")
+            logger.error(f"Ошибка пересчёта статистики рынка ({self.deal}): {str(e)}", exc_info=True)
+            return
+        self.dirty.difference_update(due)
+        for group in due:
+            self.refreshed[group] = now
+        logger.info(f"Статистика рынка ({self.deal}): пересчитано групп {len(due)}")
+
+    def hook(self, cur, returned):
+        with self.lock:
+            self.mark(returned)
+            now = time.monotonic()
+            due = [group for group in self.dirty if now - self.refreshed.get(group, float("-inf")) >= self.interval]
+            if due:
+                self._refresh_due(cur, due, now)
+
+    def flush(self, conn):
+        # При закрытии writer'а пересчитываем группы, отложенные интервалом:
+        # иначе изменения последней минуты разового запуска или обхода
+        # остались бы в статистике только к следующему запуску
+        with self.lock:
+            if not self.dirty:
+                return
+            with conn.cursor() as cur:
+                self._refresh_due(cur, list(self.dirty), time.monotonic())
+            conn.commit()
+
+    def refresh_all(self, conn):
+        # Полный пересчёт всех групп — после миграции или для сверки
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT DISTINCT city, rooms_n, COALESCE(district_id, 0) FROM {self.table}
+                WHERE city IS NOT NULL AND rooms_n IS NOT NULL
+            """)
+            groups = set()
+            for city, rooms_n, district_id in cur.fetchall():
+                groups.add((city, rooms_n, 0))
+                if district_id:
+                    groups.add((city, rooms_n, district_id))
+            self.refresh(cur, groups)
+        conn.commit()
+        logger.info(f"Статистика рынка ({self.deal}): пересчитано групп {len(groups)}")
+        return len(groups)
+
+
+MARKET_STATS = {deal: MarketStats(deal) for deal in TABLES}
+
+
+def market_stats_hook(deal):
+    return MARKET_STATS[deal].hook
+
+
+def market_stats_flush(deal):
+    return MARKET_STATS[deal].flush
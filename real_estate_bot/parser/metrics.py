@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-листенера /metrics; 0 — не запускать
+METRICS_PORT = int(os.getenv("PARSER_METRICS_PORT", "9101"))
+
+PAGES = Counter("parser_pages_total", "Загруженные страницы выдачи", ["source", "mode", "result"])
+PAGE_PHASE_SECONDS = Histogram(
+    "parser_page_phase_seconds", "Время этапов загрузки страницы", ["phase"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 40))
+ITEMS_PER_PAGE = Histogram(
+    "parser_items_per_page", "Объявлений, разобранных со страницы", ["deal"],
+    buckets=(0, 1, 5, 10, 20, 30, 40, 50, 75, 100))
+ITEMS_SKIPPED = Counter("parser_items_skipped_total", "Карточки без обязательных полей", ["deal"])
+# selector — номер запасного селектора из FIELD_SELECTORS или missing
+SELECTOR_FALLBACKS = Counter(
+    "parser_selector_fallbacks_total", "Поля карточки, найденные не основным селектором", ["field", "selector"])
+CAPTCHAS = Counter("parser_captchas_total", "Страницы с капчей", ["worker"])
+BATCH_SECONDS = Histogram(
+    "parser_db_batch_seconds", "Запись батча в БД вместе с хуками и commit", ["table"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+BATCH_ROWS = Counter("parser_db_rows_total", "Строки, записанные батчами", ["table", "result"])
+# Сколько этап стоял на полной очереди следующего: рост у fetch/extract — узкое место дальше по конвейеру
+PIPELINE_BLOCKED_SECONDS = Counter(
+    "parser_pipeline_blocked_seconds_total", "Ожидание места в очереди следующего этапа", ["stage"])
+
+
+def start_metrics_server(port=METRICS_PORT):
+    if not port:
+        return
+    try:
+        start_http_server(port)
+        logger.info(f"Метрики доступны на :{port}/metrics")
+    except OSError as e:
+        # Порт занят другим процессом парсера на этой машине — работаем без листенера
+        logger.warning(f"Не удалось открыть порт метрик {port}: {e}")
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+
+# Числовые значения из текстовых полей объявления.
+# Заполняются при сохранении, чтобы веб-фильтры работали по индексам,
+# а не разбирали строки регулярками на каждой строке таблицы.
+
+_DIGITS_RE = re.compile(r"\d+")
+_AREA_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_ROOMS_RE = re.compile(r"^\s*(\d+)\s*-\s*к")
+
+
+def parse_price(price):
+    # "45 000 ₽ в месяц" -> 45000
+    if not price:
+        return None
+    digits = "".join(_DIGITS_RE.findall(price))
+    return int(digits) if digits else None
+
+
+def parse_area(area):
+    # "42,5 м²" -> 42.5
+    if not area:
+        return None
+    match = _AREA_RE.search(area.replace("\xa0", ""))
+    return float(match.group(0).replace(",", ".")) if match else None
+
+
+def parse_rooms(rooms):
+    # "Квартира-студия" -> 0, "2-к. квартира" -> 2
+    if not rooms:
+        return None
+    if "студия" in rooms.lower():
+        return 0
+    match = _ROOMS_RE.match(rooms)
+    return int(match.group(1)) if match else None
+
+
+_ITEM_ID_RE = re.compile(r"_(\d+)/?(?:[?#]|$)")
+
+
+def parse_item_id(link):
+    # ".../kvartira-studiya_25m_1723_et._4123456789?context=..." -> 4123456789
+    if not link:
+        return None
+    match = _ITEM_ID_RE.search(link)
+    return int(match.group(1)) if match else None
+
+
+def content_hash(address, price, rooms, area, property_type=None):
+    # 64-битный хэш видимых полей объявления (знаковый, под BIGINT)
+    digest = hashlib.blake2b(
+        "\x1f".join(value or "" for value in (address, price, rooms, area, property_type)).encode("utf-8"),
+        digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
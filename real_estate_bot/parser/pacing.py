@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from metrics import PAGE_PHASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+ITEM_SELECTOR = '[data-marker="item"], div[itemprop="itemListElement"]'
+
+PAGE_TIMEOUT = float(os.getenv("PAGE_LOAD_TIMEOUT", "20"))
+# Сколько опросов подряд число карточек не должно меняться
+STABLE_POLLS = int(os.getenv("PAGE_STABLE_POLLS", "3"))
+POLL_INTERVAL = float(os.getenv("PAGE_POLL_INTERVAL", "0.3"))
+# Минимальный средний интервал между запросами к одному хосту, сек
+HOST_INTERVAL = float(os.getenv("PARSER_HOST_INTERVAL", "7.5"))
+
+
+class TokenBucket:
+    # reserve() сразу занимает токен и говорит, сколько ждать до его
+    # появления: ожидающие выстраиваются в очередь, а не делят один токен
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class HostLimiter:
+    # Вежливая частота запросов: одно ведро токенов на хост, общее для всех
+    # браузеров и потоков процесса
+
+    def __init__(self, interval=HOST_INTERVAL, burst=1):
+        self.interval = interval
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, url):
+        host = urlsplit(url).hostname or ""
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(1.0 / self.interval, self.burst)
+            return bucket
+
+    def wait(self, url):
+        if self.interval <= 0:
+            return 0.0
+        delay = self._bucket(url).reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self, url):
+        if self.interval <= 0:
+            return 0.0
+        delay = self._bucket(url).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class PhaseTimer:
+    # Время этапов загрузки одной страницы
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - started
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def __str__(self):
+        return ", ".join(f"{name} {seconds:.1f} с" for name, seconds in self.phases.items())
+
+
+class PageTimings:
+    # Сводка по этапам за весь запуск: где уходит время страницы
+    def __init__(self):
+        self.phases = {}
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def add(self, timer):
+        with self.lock:
+            self.pages += 1
+            for name, seconds in timer.phases.items():
+                PAGE_PHASE_SECONDS.labels(name).observe(seconds)
+                stats = self.phases.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+                stats["count"] += 1
+                stats["total"] += seconds
+                stats["max"] = max(stats["max"], seconds)
+
+    def summary(self):
+        with self.lock:
+            return {
+                name: {"count": stats["count"], "avg": round(stats["total"] / stats["count"], 3),
+                       "max": round(stats["max"], 3), "total": round(stats["total"], 3)}
+                for name, stats in self.phases.items()
+            }
+
+    def log(self):
+        for name, stats in self.summary().items():
+            logger.info(f"Этап {name}: в среднем {stats['avg']:.2f} с, максимум {stats['max']:.2f} с, "
+                        f"всего {stats['total']:.0f} с")
+
+
+TIMINGS = PageTimings()
+
+
+def wait_ready(driver, timeout=PAGE_TIMEOUT):
+    try:
+        WebDriverWait(driver, timeout, POLL_INTERVAL).until(
+            lambda d: d.execute_script("return document.readyState") == "complete")
+    except TimeoutException:
+        logger.warning("Страница не загрузилась полностью, продолжаем")
+
+
+def count_items(driver):
+    return driver.execute_script(f"return document.querySelectorAll('{ITEM_SELECTOR}').length")
+
+
+def wait_items_stable(driver, timeout=PAGE_TIMEOUT, polls=STABLE_POLLS):
+    # Ждём, пока подгрузка карточек после прокрутки закончится:
+    # число карточек не меняется polls опросов подряд
+    state = {"count": -1, "same": 0}
+
+    def stable(d):
+        count = count_items(d)
+        if count == state["count"]:
+            state["same"] += 1
+        else:
+            state["count"], state["same"] = count, 0
+        return count if count and state["same"] >= polls else False
+
+    try:
+        return WebDriverWait(driver, timeout, POLL_INTERVAL).until(stable)
+    except TimeoutException:
+        return max(state["count"], 0)
+
+
+def wait_images(driver, timeout=PAGE_TIMEOUT):
+    # Ленивые картинки в карточках: достаточно, чтобы загрузились начатые
+    script = (f"return Array.from(document.querySelectorAll('{ITEM_SELECTOR}'))"
+              ".flatMap(item => Array.from(item.querySelectorAll('img')))"
+              ".filter(img => img.currentSrc && !img.complete).length")
+    try:
+        WebDriverWait(driver, timeout, POLL_INTERVAL).until(lambda d: d.execute_script(script) == 0)
+    except TimeoutException:
+        logger.info("Не все изображения загрузились, продолжаем")
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import PIPELINE_BLOCKED_SECONDS
+from pacing import PhaseTimer, TIMINGS
+from common import CATEGORIES, SEEN, connect_db, listing_row
+from writer import FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Страниц HTML, ожидающих разбора, и строк, ожидающих записи
+PIPELINE_PAGES = int(os.getenv("PIPELINE_PAGES", "2"))
+PIPELINE_ITEMS = int(os.getenv("PIPELINE_ITEMS", "500"))
+PIPELINE_EXTRACTORS = int(os.getenv("PIPELINE_EXTRACTORS", "1"))
+
+_STOP = object()
+
+
+class IngestPipeline:
+    # Потоковая обработка страниц: обход → разбор и нормализация → отсев
+    # известных → запись батчами. Этапы связаны ограниченными очередями:
+    # если БД не успевает, поток записи перестаёт забирать строки, разбор
+    # упирается в полную очередь строк, а обход — в полную очередь страниц.
+    # HTML страницы и её дерево живут, только пока разбираются карточки,
+    # поэтому память не растёт с числом страниц и потоков.
+    #
+    # on_done(new, listed) вызывается из потока записи, когда все карточки
+    # страницы прошли отсев, а их строки записаны и закоммичены writer'ом:
+    # страница общей очереди не отмечается готовой раньше, чем её объявления
+    # попали в БД.
+
+    def __init__(self, extractors=PIPELINE_EXTRACTORS, pages=PIPELINE_PAGES, items=PIPELINE_ITEMS):
+        self.pages = queue.Queue(maxsize=pages)
+        self.items = queue.Queue(maxsize=items)
+        self.extract_threads = [
+            threading.Thread(target=self._extract, name=f"pipeline-extract-{n}", daemon=True)
+            for n in range(extractors)
+        ]
+        self.write_thread = threading.Thread(target=self._write, name="pipeline-write", daemon=True)
+
+    def start(self):
+        for thread in self.extract_threads:
+            thread.start()
+        self.write_thread.start()
+        return self
+
+    def submit(self, category, page, html, on_done=None):
+        # Блокируется, пока разбор не освободит место — это и есть обратное давление
+        started = time.monotonic()
+        self.pages.put((category, page, html, on_done))
+        PIPELINE_BLOCKED_SECONDS.labels("fetch").inc(time.monotonic() - started)
+
+    def close(self):
+        for _ in self.extract_threads:
+            self.pages.put(_STOP)
+        for thread in self.extract_threads:
+            thread.join()
+        self.items.put(_STOP)
+        self.write_thread.join()
+
+    def _put(self, entry):
+        started = time.monotonic()
+        self.items.put(entry)
+        blocked = time.monotonic() - started
+        PIPELINE_BLOCKED_SECONDS.labels("extract").inc(blocked)
+        return blocked
+
+    def _extract(self):
+        while True:
+            task = self.pages.get()
+            if task is _STOP:
+                return
+            category, page, html, on_done = task
+            task = None
+            listed = 0
+            blocked = 0.0
+            started = time.monotonic()
+            try:
+                for listing in CATEGORIES[category][2].iter_extract(html):
+                    listed += 1
+                    row = listing_row(listing)
+                    if row is not None:
+                        blocked += self._put(("item", category, page, listing, row))
+            except Exception as e:
+                logger.error(f"Ошибка разбора страницы {category} #{page}: {str(e)}", exc_info=True)
+            finally:
+                html = None
+                timer = PhaseTimer()
+                timer.phases["extract"] = time.monotonic() - started - blocked
+                TIMINGS.add(timer)
+                self._put(("page", category, page, listed, on_done))
+
+    def _write(self):
+        conn = None
+        writers = {}
+        new = {}
+        page_writers = {}  # (категория, страница) -> writer, которому ушли её строки
+        waiting = {}  # writer -> итоги страниц, ждущие commit его батча
+        try:
+            conn = connect_db()
+            while True:
+                try:
+                    entry = self.items.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    # Обход задерживается — не держим строки в батчах дольше интервала
+                    for writer in writers.values():
+                        writer.flush()
+                    continue
+                if entry is _STOP:
+                    break
+                kind, category, page = entry[:3]
+                if kind == "item":
+                    listing, row = entry[3:]
+                    seen = SEEN[category]
+                    seen.warm(conn)
+                    # Запомнит id сам writer после commit
+                    if seen.known(listing.avito_id, listing.content_hash):
+                        continue
+                    # Источники одной таблицы пишутся общим батчем
+                    make_writer = CATEGORIES[category][1]
+                    if make_writer not in writers:
+                        writers[make_writer] = self._writer(make_writer, conn, waiting)
+                    writer = writers[make_writer]
+                    writer.add(row)
+                    page_writers[(category, page)] = writer
+                    new[(category, page)] = new.get((category, page), 0) + 1
+                    logger.info(f"Найдено: {listing.title} | {listing.price} | {listing.address} | "
+                                f"Ссылка: {listing.link}")
+                else:
+                    listed, on_done = entry[3:]
+                    count = new.pop((category, page), 0)
+                    writer = page_writers.pop((category, page), None)
+                    if writer is not None and writer.rows:
+                        # Строки страницы ещё в батче — итог после его commit
+                        waiting.setdefault(writer, []).append((on_done, count, listed))
+                    else:
+                        self._done(on_done, count, listed)
+        except Exception as e:
+            logger.error(f"Ошибка потока записи: {str(e)}", exc_info=True)
+            self._drain()
+        finally:
+            for writer in writers.values():
+                try:
+                    writer.close()
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения остатка батча: {str(e)}")
+            if conn is not None:
+                conn.close()
+
+    def _writer(self, make_writer, conn, waiting):
+        writer = make_writer(conn)
+
+        def committed(rows):
+            # Батч пишется целиком, поэтому закоммичены строки всех ждущих страниц
+            for on_done, count, listed in waiting.pop(writer, ()):
+                self._done(on_done, count, listed)
+        writer.committed.append(committed)
+        return writer
+
+    def _drain(self):
+        # Запись невозможна: разбираем очередь до конца, чтобы обход и
+        # разбор не зависли на полной очереди, страницы считаем пустыми
+        while True:
+            entry = self.items.get()
+            if entry is _STOP:
+                return
+            if entry[0] == "page":
+                self._done(entry[4], 0, entry[3])
+
+    def _done(self, on_done, count, listed):
+        if on_done is None:
+            return
+        try:
+            on_done(count, listed)
+        except Exception as e:
+            logger.error(f"Ошибка обработки итога страницы: {str(e)}", exc_info=True)
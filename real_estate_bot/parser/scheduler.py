@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import argparse
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from crawl_queue import CrawlQueue, worker_name
+from crawler import Crawler
+from drivers import DriverManager
+from metrics import start_metrics_server
+from pacing import HostLimiter
+from common import CATEGORIES, SOURCES, connect_db, page_url, setup_driver
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_JITTER = float(os.getenv("SCHEDULE_JITTER", "0.2"))
+# Доля новых объявлений, выше которой категория обходится чаще, и ниже которой — реже
+FRESH_HIGH = float(os.getenv("SCHEDULE_FRESH_HIGH", "0.3"))
+FRESH_LOW = float(os.getenv("SCHEDULE_FRESH_LOW", "0.05"))
+
+
+class Job:
+    # Периодическая задача обхода. run() возвращает долю новых объявлений
+    # за запуск (или None), по ней подстраивается интервал: где объявления
+    # обновляются быстро, ходим чаще, где ничего не меняется — реже.
+
+    def __init__(self, name, run, interval, jitter=SCHEDULE_JITTER,
+                 min_interval=None, max_interval=None):
+        self.name = name
+        self.run = run
+        self.base_interval = interval
+        self.interval = interval
+        self.jitter = jitter
+        self.min_interval = min_interval or interval / 4
+        self.max_interval = max_interval or interval * 4
+        self.next_run = time.monotonic() + random.uniform(0, jitter * interval)
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_rate = None
+
+    def adapt(self, rate):
+        self.last_rate = rate
+        if rate is None:
+            return
+        if rate >= FRESH_HIGH:
+            self.interval = max(self.min_interval, self.interval / 2)
+        elif rate <= FRESH_LOW:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        else:
+            # Средняя свежесть — плавно возвращаемся к базовому интервалу
+            self.interval += (self.base_interval - self.interval) / 2
+
+    def schedule_next(self):
+        delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        self.next_run = time.monotonic() + delay
+        return delay
+
+
+@contextmanager
+def job_lock(name):
+    # Advisory-lock в Postgres: одна задача не запускается дважды,
+    # даже если планировщиков несколько
+    conn = connect_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"crawl:{name}",))
+            acquired = cur.fetchone()[0]
+        yield acquired
+    finally:
+        conn.close()  # блокировка уровня сессии снимается вместе с соединением
+
+
+class Scheduler:
+    def __init__(self, jobs, lock=job_lock):
+        self.jobs = jobs
+        self.lock = lock
+        self.executor = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="job")
+        self.stopped = threading.Event()
+
+    def run_forever(self):
+        logger.info(f"Планировщик запущен: {', '.join(job.name for job in self.jobs)}")
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                # running меняется только здесь и в конце _run: экземпляр задачи всегда один
+                if not job.running and job.next_run <= now:
+                    job.running = True
+                    self.executor.submit(self._run, job)
+            waiting = [job.next_run for job in self.jobs if not job.running]
+            wait = min(waiting) - time.monotonic() if waiting else 30
+            self.stopped.wait(min(max(wait, 0.5), 30))
+        self.executor.shutdown(wait=True)
+        logger.info("Планировщик остановлен")
+
+    def stop(self, *args):
+        self.stopped.set()
+
+    def _run(self, job):
+        started = time.monotonic()
+        try:
+            with self.lock(job.name) as acquired:
+                if not acquired:
+                    logger.info(f"{job.name}: уже выполняется в другом процессе, пропускаем")
+                    return
+                job.runs += 1
+                job.adapt(job.run())
+                rate = "н/д" if job.last_rate is None else f"{job.last_rate:.0%}"
+                logger.info(f"{job.name}: запуск за {time.monotonic() - started:.0f} с, "
+                            f"новых {rate}, интервал {job.interval:.0f} с")
+        except Exception as e:
+            job.failures += 1
+            logger.error(f"{job.name}: ошибка запуска: {str(e)}", exc_info=True)
+        finally:
+            job.schedule_next()
+            job.running = False
+
+
+def crawl_job(source, pages, workers, page_interval, drivers, limiter, http=False):
+    def run():
+        stats = Crawler([source.name], pages or source.pages, workers, page_interval, drivers=drivers, http=http,
+                        limiter=limiter).run()
+        return stats["items"] / stats["listed"] if stats["listed"] else None
+    return run
+
+
+def enqueue_job(source, pages):
+    # В режиме общей очереди задача только ставит страницы в crawl_queue,
+    # обходят их процессы parser.py --queue --follow на любых машинах.
+    # Свежесть берётся по страницам, обойдённым с прошлой постановки.
+    state = {"since": None}
+
+    def run():
+        crawl_queue = CrawlQueue(connect_db(), worker_name(f"schedule-{source.name}"))
+        try:
+            rate = crawl_queue.fresh_rate(source.name, state["since"]) if state["since"] else None
+            state["since"] = crawl_queue.now()
+            crawl_queue.enqueue(source, pages or source.pages, page_url)
+            return rate
+        finally:
+            crawl_queue.close()
+    return run
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Планировщик обхода Avito")
+    arg_parser.add_argument("--categories", nargs="+", choices=sorted(CATEGORIES), default=list(CATEGORIES),
+                            help="источники из sources.yaml")
+    arg_parser.add_argument("--interval", type=float, default=None,
+                            help="базовый интервал между обходами источника, сек (по умолчанию из sources.yaml)")
+    arg_parser.add_argument("--jitter", type=float, default=SCHEDULE_JITTER,
+                            help="случайный разброс интервала, доля")
+    arg_parser.add_argument("--pages", type=int, default=None)
+    arg_parser.add_argument("--workers", type=int, default=int(os.getenv("CRAWL_WORKERS", "1")),
+                            help="браузеров на один источник")
+    arg_parser.add_argument("--page-interval", type=float, default=float(os.getenv("CRAWL_PAGE_INTERVAL", "15")))
+    arg_parser.add_argument("--http", action="store_true")
+    arg_parser.add_argument("--queue", action="store_true",
+                            help="только ставить страницы в общую очередь crawl_queue")
+    args = arg_parser.parse_args()
+    start_metrics_server()
+
+    sources = [SOURCES[name] for name in args.categories]
+    drivers = None
+    if args.queue:
+        runs = [enqueue_job(source, args.pages) for source in sources]
+    else:
+        # Браузеры общие на все задачи и остаются прогретыми между запусками
+        browsers = args.workers * len(sources)
+        drivers = DriverManager(setup_driver, size=browsers)
+        # И общий лимит частоты запросов к сайту на все задачи
+        limiter = HostLimiter(args.page_interval / browsers)
+        runs = [crawl_job(source, args.pages, args.workers, args.page_interval, drivers, limiter, args.http)
+                for source in sources]
+
+    jobs = [Job(source.name, run, interval=args.interval or source.interval, jitter=args.jitter)
+            for source, run in zip(sources, runs)]
+    scheduler = Scheduler(jobs)
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    try:
+        scheduler.run_forever()
+    finally:
+        if drivers:
+            drivers.close()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SEEN_CACHE_SIZE = int(os.getenv("SEEN_CACHE_SIZE", "200000"))
+
+
+class SeenCache:
+    # Ограниченный LRU avito_id -> хэш содержимого уже сохранённых объявлений.
+    # Прогревается из БД при первом использовании, дальше проверка
+    # "видели ли карточку в таком виде" обходится без запроса к базе.
+
+    def __init__(self, table, capacity=SEEN_CACHE_SIZE):
+        self.table = table
+        self.capacity = capacity
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+        self.warmed = False
+
+    def warm(self, conn):
+        with self.lock:
+            if self.warmed:
+                return
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT avito_id, content_hash FROM {self.table} "
+                    f"WHERE avito_id IS NOT NULL ORDER BY id DESC LIMIT %s",
+                    (self.capacity,))
+                rows = cur.fetchall()
+            # Самые свежие id должны оказаться в конце — дальше всего от вытеснения
+            for avito_id, content_hash in reversed(rows):
+                self.ids[avito_id] = content_hash
+            self.warmed = True
+        logger.info(f"Кэш просмотренных объявлений {self.table}: {len(rows)} id")
+
+    def known(self, avito_id, content_hash):
+        with self.lock:
+            if avito_id in self.ids:
+                self.ids.move_to_end(avito_id)
+                return self.ids[avito_id] == content_hash
+            return False
+
+    def add(self, avito_id, content_hash):
+        with self.lock:
+            self.ids[avito_id] = content_hash
+            self.ids.move_to_end(avito_id)
+            if len(self.ids) > self.capacity:
+                self.ids.popitem(last=False)
+
+    def filter_new(self, listings):
+        # Возвращает новые и изменившиеся объявления; кэш не меняется —
+        # id запоминаются только после commit (см. committed_hook)
+        return [listing for listing in listings
+                if listing.avito_id is not None and not self.known(listing.avito_id, listing.content_hash)]
+
+    def committed_hook(self, columns):
+        # Для BatchWriter(committed=...): строки, попавшие в БД, запоминаются
+        # с их хэшем. Отброшенная строка в кэш не попадает и при следующем
+        # обходе будет записана снова.
+        id_index = columns.index("avito_id")
+        hash_index = columns.index("content_hash")
+
+        def remember(rows):
+            for row in rows:
+                self.add(row[id_index], row[hash_index])
+        return remember
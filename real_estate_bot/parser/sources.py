@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import os
+from dataclasses import dataclass
+
+import yaml
+
+SOURCES_FILE = os.getenv("PARSER_SOURCES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sources.yaml"))
+
+DEALS = ("rent", "sale")
+
+
+@dataclass(slots=True)
+class Source:
+    name: str
+    city: str
+    deal: str  # "rent" или "sale"
+    category: str
+    url: str
+    pages: int = 5
+    interval: float = 900.0
+    enabled: bool = True
+
+
+def load_sources(path=SOURCES_FILE, enabled_only=True):
+    # Реестр источников из YAML: {name: Source} в порядке объявления
+    with open(path, encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+
+    defaults = config.get("defaults") or {}
+    sources = {}
+    for entry in config.get("sources") or []:
+        try:
+            source = Source(**{**defaults, **entry})
+        except TypeError as e:
+            raise ValueError(f"Некорректный источник в {path}: {entry}: {e}")
+        if source.deal not in DEALS:
+            raise ValueError(f"Источник {source.name}: неизвестный тип сделки {source.deal!r}")
+        if source.name in sources:
+            raise ValueError(f"Источник {source.name} объявлен дважды в {path}")
+        sources[source.name] = source
+
+    if enabled_only:
+        sources = {name: source for name, source in sources.items() if source.enabled}
+    return sources
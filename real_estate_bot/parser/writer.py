@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import time
+
+from psycopg2.extras import execute_values
+
+from metrics import BATCH_ROWS, BATCH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("PARSER_BATCH_SIZE", "100"))
+FLUSH_INTERVAL = float(os.getenv("PARSER_FLUSH_INTERVAL", "5"))
+
+
+class BatchWriter:
+    # Копит строки и пишет их пачкой: один INSERT и один commit на батч
+    # вместо пары запрос+commit на каждое объявление.
+    #
+    # returning — выражение для RETURNING; возвращённые строки передаются
+    # в hooks(cur, rows) в той же транзакции, до commit.
+    # committed — callback(rows) после commit с записанными строками батча;
+    # строки, отброшенные при построчной записи, туда не попадают.
+    # on_close — callback(conn) после последнего flush в close().
+    # key — колонка-ключ: в батче остаётся последняя строка с каждым ключом,
+    # иначе ON CONFLICT DO UPDATE упадёт на повторе внутри одного INSERT.
+
+    def __init__(self, conn, table, columns, conflict="ON CONFLICT (address) DO NOTHING",
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, returning=None, hooks=(), key=None,
+                 committed=(), on_close=()):
+        self.conn = conn
+        self.table = table
+        self.columns = columns
+        self.conflict = conflict
+        self.key_index = columns.index(key) if key else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.hooks = list(hooks)
+        self.committed = list(committed)
+        self.on_close = list(on_close)
+        self.rows = []
+        self.last_flush = time.monotonic()
+        self.written = 0
+        self.changed = 0
+        self.failed = 0
+        self.query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s {conflict}"
+        if returning:
+            self.query += f" RETURNING {returning}"
+        self.fetch = bool(returning)
+
+    def add(self, row):
+        self.rows.append(row)
+        if (len(self.rows) >= self.batch_size or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def _execute(self, cur, rows):
+        returned = execute_values(cur, self.query, rows, page_size=len(rows), fetch=self.fetch)
+        return returned or []
+
+    def _run_hooks(self, cur, returned):
+        for hook in self.hooks:
+            hook(cur, returned)
+
+    def _run_committed(self, rows):
+        for callback in self.committed:
+            try:
+                callback(rows)
+            except Exception as e:
+                logger.error(f"Ошибка обработки записанных строк {self.table}: {str(e)}", exc_info=True)
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        if self.key_index is not None:
+            rows = list({row[self.key_index]: row for row in rows}.values())
+        started = time.monotonic()
+        try:
+            with self.conn.cursor() as cur:
+                returned = self._execute(cur, rows)
+                self._run_hooks(cur, returned)
+            self.conn.commit()
+            BATCH_SECONDS.labels(self.table).observe(time.monotonic() - started)
+            BATCH_ROWS.labels(self.table, "written").inc(len(rows))
+            self.written += len(rows)
+            self.changed += len(returned)
+            logger.info(f"Сохранено в {self.table}: {len(rows)} строк, изменено {len(returned)}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения батча в {self.table}: {str(e)}")
+            self.conn.rollback()
+            self._write_one_by_one(rows)
+            return
+        self._run_committed(rows)
+
+    def _write_one_by_one(self, rows):
+        # Батч откатился целиком — повторяем построчно через savepoint,
+        # чтобы одна битая строка не утянула за собой всю страницу
+        saved = []
+        with self.conn.cursor() as cur:
+            for row in rows:
+                cur.execute("SAVEPOINT batch_row")
+                try:
+                    returned = self._execute(cur, [row])
+                    self._run_hooks(cur, returned)
+                    cur.execute("RELEASE SAVEPOINT batch_row")
+                    BATCH_ROWS.labels(self.table, "written").inc()
+                    self.written += 1
+                    self.changed += len(returned)
+                    saved.append(row)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT batch_row")
+                    BATCH_ROWS.labels(self.table, "failed").inc()
+                    self.failed += 1
+                    logger.error(f"Пропущена строка {self.table}: {str(e)} | {row}")
+        self.conn.commit()
+        self._run_committed(saved)
+
+    def close(self):
+        self.flush()
+        for callback in self.on_close:
+            try:
+                callback(self.conn)
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Ошибка завершения записи в {self.table}: {str(e)}", exc_info=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
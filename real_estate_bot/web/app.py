@@ -1,21 +1,80 @@
-from flask import Flask, request, render_template
-import psycopg2
+from flask import Flask, request, render_template, jsonify
 from dotenv import load_dotenv
-import os
-import requests
+import logging
+import math
+import time
+from db import db
+from delivery import TelegramDelivery
+from cache import LRUCache, create_cache
+from paging import PAGE_SIZE, SORTS, select_columns, order_by, next_page_data
+from market import MarketStats
+from metrics import QUERY_SECONDS, filter_shape, register_stats, render
 
 load_dotenv()
 app = Flask(__name__)
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "port": os.getenv("DB_PORT", "5433")
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Отправка в Telegram идёт в фоне, обработчик запроса её не ждёт
+delivery = TelegramDelivery(db=db).start()
+# Результаты поиска кэшируются до следующего батча парсера по этой таблице
+cache = create_cache()
+register_stats(db=db.metrics, telegram=delivery.metrics, cache=cache.metrics)
+# Районы и станции метро для форм: новые места появляются редко,
+# поэтому справочник достаточно перечитывать раз в несколько минут
+places_cache = LRUCache(maxsize=1, ttl=300)
+# Статистика рынка, которую пересчитывает парсер (таблица market_stats)
+market = MarketStats(db)
+
+
+# Поля формы поиска: разбор, наибольшее допустимое значение и подпись для
+# сообщения об ошибке. Пределы — по типам колонок, чтобы запрос не падал в БД.
+FILTER_FIELDS = {
+    "rooms": (int, 100, "Количество комнат"),
+    "area": (float, 999999, "Площадь"),
+    "price": (int, 10 ** 15, "Цена"),
+    "district": (int, 2 ** 31 - 1, "Район"),
+    "metro": (int, 2 ** 31 - 1, "Метро"),
 }
+PROPERTY_TYPES = ("any", "новостройка", "вторичка")
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_number(value, convert, maximum):
+    # "1 000" и "42,5" допустимы; пробелы — разделители разрядов
+    value = value.replace(" ", "").replace("\xa0", "").replace(",", ".")
+    number = convert(value)
+    if not math.isfinite(number) or not 0 <= number <= maximum:
+        raise ValueError(value)
+    return number
 
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{os.getenv('BOT_TOKEN')}/sendMessage"
+
+def parse_filters(form):
+    # Значения фильтров в типах колонок (пустое поле — None) или FilterError
+    # с текстом для формы: ввод вроде "2к" не должен превращаться в 500
+    filters = {}
+    for name, (convert, maximum, label) in FILTER_FIELDS.items():
+        value = (form.get(name) or "").strip()
+        try:
+            filters[name] = parse_number(value, convert, maximum) if value else None
+        except ValueError:
+            raise FilterError(f"{label}: некорректное значение «{value}»")
+    property_type = form.get("type") or None
+    if property_type is not None and property_type not in PROPERTY_TYPES:
+        raise FilterError("Тип жилья: некорректное значение")
+    filters["property_type"] = property_type if property_type != "any" else None
+    filters["sort"] = form.get("sort") if form.get("sort") in SORTS else "n"
+    return filters
+
+
+def parse_chat_id(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        raise FilterError("Подписка: некорректный user_id")
 
 
 @app.route("/")
@@ -28,152 +87,231 @@ def index():
 def rent():
     user_id = request.args.get("user_id")
     if request.method == "POST":
-        rooms = request.form.get("rooms")
-        area = request.form.get("area")
-
-        query = "SELECT address, price, rooms, area, link FROM rental WHERE TRUE"
+        try:
+            filters = parse_filters(request.form)
+            chat_id = parse_chat_id(user_id) if user_id and request.form.get("subscribe") else None
+        except FilterError as e:
+            return render_template("rent_filters.html", user_id=user_id, places=load_places(),
+                                   error=str(e), form=request.form), 400
+        rooms, area, price, district, metro, sort = (filters[name] for name in
+                                                     ("rooms", "area", "price", "district", "metro", "sort"))
+
+        query = f"SELECT {select_columns(sort)} FROM rental WHERE TRUE"
         params = []
 
-        if rooms:
-            room_mapping = {
-                "0": "Квартира-студия",
-                "1": "1-к. квартира",
-                "2": "2-к. квартира",
-                "3": "3-к. квартира",
-                "4": "4-к. квартира",
-                "5": "5-к. квартира"
-            }
-            query += " AND rooms = %s"
-            params.append(room_mapping[rooms])
-
-        if area:
-            query += """
-            AND CAST(
-                NULLIF(
-                    REPLACE(
-                        REGEXP_REPLACE(
-                            REPLACE(area, ' м²', ''),
-                            '[^0-9,]', '', 'g'
-                        ),
-                        ',', '.'
-                    ),
-                    ''
-                ) AS numeric
-            ) >= %s
-            """
-            params.append(float(area.replace(',', '.')))
-
-        results = get_results(query, params)
+        if rooms is not None:
+            query += " AND rooms_n = %s"
+            params.append(rooms)
+
+        if area is not None:
+            query += " AND area_m2 >= %s"
+            params.append(area)
+
+        if price is not None:
+            query += " AND price_rub <= %s"
+            params.append(price)
+
+        if district is not None:
+            query += " AND district_id = %s"
+            params.append(district)
+
+        if metro is not None:
+            query += " AND metro_id = %s"
+            params.append(metro)
+
+        query += order_by(sort)
+        params.append(PAGE_SIZE + 1)
+        results = get_results(query, params, "rental",
+                              filter_shape(rooms=rooms, area=area, price=price, district=district, metro=metro), sort)
+
+        if chat_id is not None:
+            save_subscription(chat_id, "rent", rooms, area, price)
 
         if not results:
             return render_template("results.html", user_id=user_id)
 
         if user_id:
-            send_to_telegram(user_id, results)
+            next_page = None
+            if len(results) > PAGE_SIZE:
+                next_page = next_page_data("rent", sort, rooms, area, price, None, results[PAGE_SIZE - 1],
+                                           district, metro)
+            send_to_telegram(user_id, results[:PAGE_SIZE], next_page, "rent")
 
         return render_template("results.html", has_results=bool(results))
 
-    return render_template("rent_filters.html", user_id=user_id)
+    return render_template("rent_filters.html", user_id=user_id, places=load_places())
 
 
 @app.route("/buy", methods=["GET", "POST"])
 def buy():
     user_id = request.args.get("user_id")
     if request.method == "POST":
-        rooms = request.form.get("rooms")
-        area = request.form.get("area")
-        property_type = request.form.get("type")
-
-        query = "SELECT address, price, rooms, area, link FROM sale WHERE TRUE"
+        try:
+            filters = parse_filters(request.form)
+            chat_id = parse_chat_id(user_id) if user_id and request.form.get("subscribe") else None
+        except FilterError as e:
+            return render_template("buy_filters.html", user_id=user_id, places=load_places(),
+                                   error=str(e), form=request.form), 400
+        rooms, area, price, property_type, district, metro, sort = (
+            filters[name] for name in ("rooms", "area", "price", "property_type", "district", "metro", "sort"))
+
+        query = f"SELECT {select_columns(sort)} FROM sale WHERE TRUE"
         params = []
 
-        if rooms:
-            room_mapping = {
-                "0": "Квартира-студия",
-                "1": "1-к. квартира",
-                "2": "2-к. квартира",
-                "3": "3-к. квартира",
-                "4": "4-к. квартира",
-                "5": "5-к. квартира"
-            }
-            query += " AND rooms = %s"
-            params.append(room_mapping[rooms])
-
-        if area:
-            query += """
-            AND CAST(
-                NULLIF(
-                    REPLACE(
-                        REGEXP_REPLACE(
-                            REPLACE(area, ' м²', ''),
-                            '[^0-9,]', '', 'g'
-                        ),
-                        ',', '.'
-                    ),
-                    ''
-                ) AS numeric
-            ) >= %s
-            """
-            params.append(float(area.replace(',', '.')))
-
-        if property_type and property_type != "any":
+        if rooms is not None:
+            query += " AND rooms_n = %s"
+            params.append(rooms)
+
+        if area is not None:
+            query += " AND area_m2 >= %s"
+            params.append(area)
+
+        if price is not None:
+            query += " AND price_rub <= %s"
+            params.append(price)
+
+        if district is not None:
+            query += " AND district_id = %s"
+            params.append(district)
+
+        if metro is not None:
+            query += " AND metro_id = %s"
+            params.append(metro)
+
+        if property_type:
             query += " AND property_type = %s"
             params.append(property_type)
 
-        # Остальной код остается без изменений
-        results = get_results(query, params)
+        query += order_by(sort)
+        params.append(PAGE_SIZE + 1)
+        shape = filter_shape(rooms=rooms, area=area, price=price, type=property_type, district=district, metro=metro)
+        results = get_results(query, params, "sale", shape, sort)
+
+        if chat_id is not None:
+            save_subscription(chat_id, "sale", rooms, area, price, property_type)
 
         if not results:
             return render_template("results.html", user_id=user_id)
 
         if user_id:
-            send_to_telegram(user_id, results)
+            next_page = None
+            if len(results) > PAGE_SIZE:
+                next_page = next_page_data("sale", sort, rooms, area, price, property_type,
+                                           results[PAGE_SIZE - 1], district, metro)
+            send_to_telegram(user_id, results[:PAGE_SIZE], next_page, "sale")
 
         return render_template("results.html", has_results=bool(results))
 
-    return render_template("buy_filters.html", user_id=user_id)
+    return render_template("buy_filters.html", user_id=user_id, places=load_places())
 
-def get_results(query, params=None):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    cur.execute(query, params or ())
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+def get_results(query, params=None, table=None, shape="none", sort="n"):
+    def load(query, params):
+        started = time.monotonic()
+        try:
+            return db.fetchall(query, params)
+        finally:
+            QUERY_SECONDS.labels(table or "other", shape, sort).observe(time.monotonic() - started)
 
+    if table is None:
+        return load(query, params)
+    return cache.fetch(table, query, params, load)
 
-def send_to_telegram(user_id, results):
-    print(f"Attempting to send to Telegram. User ID: {user_id}")  # Отладочная печать
-    print(f"Results count: {len(results)}")  # Отладочная печать
+
+def load_places():
+    places = places_cache.get("places")
+    if places is not None:
+        return places
+    places = {"district": [], "metro": []}
+    try:
+        rows = get_results("SELECT id, city, kind, name FROM geo_places ORDER BY city, kind, name")
+    except Exception as e:
+        # Форма работает и без справочника, просто без фильтра по месту
+        logger.error(f"Не удалось загрузить справочник мест: {e}")
+        return places
+    for place_id, city, kind, name in rows:
+        places[kind].append({"id": place_id, "city": city, "name": name})
+    places_cache.set("places", places)
+    return places
+
+
+def save_subscription(chat_id, deal, rooms, area, price, property_type=None):
+    # Новые объявления по этим фильтрам парсер пришлёт в Telegram сам;
+    # значения — уже разобранные parse_filters
+    db.execute("""
+        INSERT INTO subscriptions (chat_id, deal, rooms_n, min_area, max_price, property_type)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (chat_id, deal) DO UPDATE SET
+            rooms_n = EXCLUDED.rooms_n,
+            min_area = EXCLUDED.min_area,
+            max_price = EXCLUDED.max_price,
+            property_type = EXCLUDED.property_type,
+            active = TRUE
+    """, (chat_id, deal, rooms, area, price, property_type))
+
+
+def send_to_telegram(user_id, results, next_page=None, deal=None):
+    logger.info(f"Отправка в Telegram: user_id={user_id}, результатов: {len(results)}")
 
     if not results:
         text = "🔍 По вашим фильтрам ничего не найдено.\n\nПопробуйте изменить параметры поиска."
     else:
+        percentiles = [None] * len(results)
+        if deal:
+            try:
+                percentiles = market.percentiles(deal, results)
+            except Exception as e:
+                logger.warning(f"Статистика рынка недоступна: {e}")
         text = "🏡 *Найдены подходящие предложения:*\n\n"
-        for r in results[:5]:
-            address, price, rooms, area, link = r
+        for r, percentile in zip(results, percentiles):
+            address, price, rooms, area, link = r[:5]
             text += f"📍 *Адрес:* {address}\n"
             text += f"💵 *Цена:* {price}\n"
             text += f"🛏 *Комнат:* {rooms}\n"
             text += f"📏 *Площадь:* {area}\n"
+            if percentile is not None:
+                text += f"📊 *Цена за м²:* дороже, чем у {percentile}% похожих\n"
             if link:
                 text += f"🔗 [Ссылка на объявление]({link})\n"
             text += "\n"
 
-
-
     payload = {
         "chat_id": user_id,
         "text": text,
         "parse_mode": "Markdown",
         "disable_web_page_preview": True
     }
+    if next_page:
+        payload["reply_markup"] = {"inline_keyboard": [[{"text": "Далее ▶", "callback_data": next_page}]]}
+
+    try:
+        delivery.enqueue(user_id, payload)
+    except Exception as e:
+        logger.error(f"Не удалось поставить сообщение в очередь: {e}")
+
 
+@app.route("/stats/<deal>")
+def stats(deal):
+    # Готовые процентили цены по группам: ?city=&rooms=&district= (0 — весь город)
+    if deal not in ("rent", "sale"):
+        return jsonify(error="deal: rent или sale"), 404
     try:
-        response = requests.post(TELEGRAM_API_URL, data=payload)
-        print(f"Telegram API response: {response.status_code}, {response.text}")  # Отладочная печать
+        rooms = request.args.get("rooms", type=int)
+        district = request.args.get("district", type=int)
+        groups = market.summary(deal, request.args.get("city"), rooms, district)
     except Exception as e:
-        print(f"Error sending to Telegram: {e}")  # Отладочная печать
+        logger.error(f"Ошибка чтения статистики рынка: {e}")
+        return jsonify(error="статистика недоступна"), 503
+    return jsonify(deal=deal, groups=groups)
+
+
+@app.route("/metrics")
+def metrics():
+    return render()
+
+
+@app.route("/health")
+def health():
+    return jsonify(db=db.metrics(), telegram=delivery.metrics(), cache=cache.metrics())
 
 
 if __name__ == "__main__":
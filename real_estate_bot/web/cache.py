@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+
+from db import DB_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "600"))
+# redis://... — общий кэш для нескольких процессов веб-приложения
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+CHANNEL = "cache_generation"
+
+
+class LRUCache:
+    # Кэш в памяти процесса: ограничение по числу записей и времени жизни
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+
+class RedisCache:
+    # Любой клиент с методами get(key) и set(key, value, ex=seconds):
+    # redis.Redis, совместимые серверы или простая заглушка в памяти
+    def __init__(self, client, ttl=CACHE_TTL, prefix="realestate:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False, default=str), ex=int(self.ttl))
+
+
+class Generations:
+    # Текущие поколения таблиц. Загружаются из cache_generation и
+    # обновляются по NOTIFY от парсера, который приходит сразу после commit.
+
+    def __init__(self, config=None):
+        self.config = config or DB_CONFIG
+        self.values = {}
+        self.lock = threading.Lock()
+        self.started = False
+        self.ready = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self._listen, name="cache-generations", daemon=True).start()
+        self.ready.wait(timeout=2)
+
+    def get(self, table):
+        self.start()
+        with self.lock:
+            # Пока слушатель не подключился, кэш не используется
+            return self.values.get(table) if self.ready.is_set() else None
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                    # Перечитываем после LISTEN, чтобы не пропустить изменения между ними
+                    cur.execute("SELECT table_name, generation FROM cache_generation")
+                    with self.lock:
+                        self.values = dict(cur.fetchall())
+                self.ready.set()
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        table, generation = conn.notifies.pop(0).payload.rsplit(":", 1)
+                        with self.lock:
+                            self.values[table] = max(self.values.get(table, 0), int(generation))
+            except Exception as e:
+                logger.error(f"Ошибка подписки на поколения кэша: {e}")
+                self.ready.clear()
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+class QueryCache:
+    def __init__(self, backend, generations):
+        self.backend = backend
+        self.generations = generations
+        self.stats = {"hits": 0, "misses": 0, "bypass": 0}
+        self.lock = threading.Lock()
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def fetch(self, table, query, params, load):
+        # Ключ — таблица, её поколение и нормализованные фильтры запроса
+        generation = self.generations.get(table)
+        if generation is None:
+            self._count("bypass")
+            return load(query, params)
+
+        key = json.dumps([table, generation, query, list(params or ())], ensure_ascii=False, default=str)
+        try:
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Кэш недоступен: {e}")
+            cached = None
+        if cached is not None:
+            self._count("hits")
+            return [tuple(row) for row in cached]
+
+        self._count("misses")
+        rows = load(query, params)
+        try:
+            self.backend.set(key, rows)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить в кэш: {e}")
+        return rows
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats)
+
+
+def create_cache():
+    if CACHE_REDIS_URL:
+        import redis
+        backend = RedisCache(redis.Redis.from_url(CACHE_REDIS_URL))
+    else:
+        backend = LRUCache()
+    return QueryCache(backend, Generations())
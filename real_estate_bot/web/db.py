@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "port": os.getenv("DB_PORT", "5433")
+}
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Сколько ждать свободного соединения и сколько может идти один запрос, мс
+POOL_TIMEOUT_MS = int(os.getenv("DB_POOL_TIMEOUT_MS", "5000"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "3000"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Database:
+    # Пул соединений для веб-приложения. ThreadedConnectionPool сам по себе
+    # не ждёт освобождения соединения, а сразу падает, поэтому выдача
+    # ограничена семафором на max соединений.
+
+    def __init__(self, minconn=POOL_MIN, maxconn=POOL_MAX, timeout_ms=POOL_TIMEOUT_MS,
+                 statement_timeout_ms=STATEMENT_TIMEOUT_MS, **config):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout_ms / 1000
+        self.config = dict(config or DB_CONFIG)
+        self.config["options"] = f"-c statement_timeout={statement_timeout_ms}"
+        self.pool = None
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.stats = {"checkouts": 0, "in_use": 0, "timeouts": 0, "errors": 0, "wait_seconds": 0.0}
+
+    def _pool(self):
+        # Пул создаётся при первом запросе, а не при импорте модуля
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.config)
+        return self.pool
+
+    @contextmanager
+    def connection(self):
+        started = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.stats["timeouts"] += 1
+            raise PoolTimeout(f"Нет свободного соединения с БД за {self.timeout:.1f} с")
+
+        pool = None
+        conn = None
+        broken = False
+        try:
+            pool = self._pool()
+            conn = pool.getconn()
+            with self.lock:
+                self.stats["checkouts"] += 1
+                self.stats["in_use"] += 1
+                self.stats["wait_seconds"] += time.monotonic() - started
+            yield conn
+            conn.rollback()  # закрываем транзакцию чтения перед возвратом в пул
+        except Exception:
+            with self.lock:
+                self.stats["errors"] += 1
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            if conn is not None:
+                with self.lock:
+                    self.stats["in_use"] -= 1
+                pool.putconn(conn, close=broken or conn.closed != 0)
+            self.slots.release()
+
+    def fetchall(self, query, params=None):
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                return cur.fetchall()
+
+    def execute(self, query, params=None, fetch=False):
+        # Запрос на запись с commit; fetch=True — вернуть строки RETURNING
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                rows = cur.fetchall() if fetch else None
+            conn.commit()
+            return rows
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["size_max"] = self.maxconn
+        if self.pool is not None:
+            stats["idle"] = len(self.pool._pool)
+        return stats
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+
+
+db = Database()
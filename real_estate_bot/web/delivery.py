@@ -0,0 +1,289 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+
+from metrics import TELEGRAM_RATE_LIMITED, TELEGRAM_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# TELEGRAM_API_URL — другой адрес Bot API: локальный сервер или заглушка в нагрузочном тесте
+TELEGRAM_API = f"{os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')}/bot{os.getenv('BOT_TOKEN')}"
+
+DELIVERY_WORKERS = int(os.getenv("TELEGRAM_WORKERS", "4"))
+MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "5"))
+# Ограничения Telegram: не больше ~1 сообщения в секунду в один чат
+# и ~30 сообщений в секунду на бота в целом
+CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.0"))
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+# Хранить очередь в таблице telegram_outbox, чтобы сообщения переживали перезапуск
+PERSIST = os.getenv("TELEGRAM_OUTBOX_PERSIST", "0") == "1"
+# Отправлять сообщения из telegram_outbox (в том числе уведомления парсера
+# по подпискам) независимо от PERSIST; 0 — если их отправляет другой процесс
+OUTBOX_POLL = os.getenv("TELEGRAM_OUTBOX_POLL", "1") == "1"
+# Сколько строк outbox процесс держит в отправке одновременно. При ~30
+# сообщениях в секунду 300 строк уходят за десяток секунд — задолго до того,
+# как строку в sending заберут повторно (OUTBOX_LEASE)
+OUTBOX_INFLIGHT = int(os.getenv("TELEGRAM_OUTBOX_INFLIGHT", "300"))
+OUTBOX_LEASE = "5 minutes"
+# Как часто продлевать locked_at строк, которые ещё ждут отправки, сек
+OUTBOX_HEARTBEAT = 60.0
+
+
+class Message:
+    __slots__ = ("chat_id", "method", "payload", "attempts", "outbox_id")
+
+    def __init__(self, chat_id, payload, method="sendMessage", outbox_id=None):
+        self.chat_id = chat_id
+        self.method = method
+        self.payload = payload
+        self.attempts = 0
+        self.outbox_id = outbox_id
+
+
+class DelayQueue:
+    # Очередь с отложенной выдачей: get() отдаёт сообщение не раньше его срока
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+
+    def put(self, item, delay=0.0):
+        with self.cond:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), item))
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while True:
+                if self.heap:
+                    due = self.heap[0][0] - time.monotonic()
+                    if due <= 0:
+                        return heapq.heappop(self.heap)[2]
+                    self.cond.wait(due)
+                else:
+                    self.cond.wait()
+
+    def qsize(self):
+        with self.cond:
+            return len(self.heap)
+
+
+class RateLimiter:
+    # Интервал между сообщениями в один чат плюс общий лимит на бота
+    def __init__(self, chat_interval=CHAT_INTERVAL, global_rate=GLOBAL_RATE):
+        self.chat_interval = chat_interval
+        self.global_interval = 1.0 / global_rate
+        self.next_chat = {}
+        self.next_global = 0.0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, chat_id):
+        # 0 — можно отправлять сейчас (слот занят), иначе сколько подождать
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.next_chat.get(chat_id, 0.0), self.next_global) - now
+            if wait > 0:
+                return wait
+            self.next_chat[chat_id] = now + self.chat_interval
+            self.next_global = now + self.global_interval
+            if len(self.next_chat) > 10000:
+                self.next_chat = {k: v for k, v in self.next_chat.items() if v > now}
+            return 0.0
+
+    def pause(self, seconds, chat_id=None):
+        # После 429 Telegram сообщает retry_after — не шлём до его истечения
+        with self.lock:
+            until = time.monotonic() + seconds
+            if chat_id is None:
+                self.next_global = max(self.next_global, until)
+            else:
+                self.next_chat[chat_id] = max(self.next_chat.get(chat_id, 0.0), until)
+
+
+class TelegramDelivery:
+    # Фоновая отправка сообщений: веб-обработчик только ставит сообщение
+    # в очередь, отправкой занимается пул потоков со своими keep-alive сессиями.
+    # start() вызывается при запуске приложения: сообщения, сохранённые
+    # в outbox до перезапуска, уходят сразу, а не с первой новой отправкой.
+
+    def __init__(self, workers=DELIVERY_WORKERS, persist=PERSIST, db=None, poll_outbox=OUTBOX_POLL):
+        self.workers = workers
+        self.persist = persist
+        self.poll_outbox = db is not None and (poll_outbox or persist)
+        self.db = db
+        self.queue = DelayQueue()
+        self.limiter = RateLimiter()
+        self.lock = threading.Lock()
+        self.started = False
+        self.inflight = set()  # id строк outbox, забранных этим процессом
+        self.stats = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "rate_limited": 0}
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return self
+            self.started = True
+        for n in range(self.workers):
+            threading.Thread(target=self._worker, name=f"telegram-{n}", daemon=True).start()
+        if self.poll_outbox:
+            threading.Thread(target=self._poll_outbox, name="telegram-outbox", daemon=True).start()
+        return self
+
+    def enqueue(self, chat_id, payload, method="sendMessage"):
+        self._count("enqueued")
+        if self.persist:
+            # Сообщение заберёт поток опроса outbox
+            self.db.execute(
+                "INSERT INTO telegram_outbox (chat_id, method, payload) VALUES (%s, %s, %s)",
+                (chat_id, method, json.dumps(payload, ensure_ascii=False)))
+        else:
+            self.queue.put(Message(chat_id, payload, method))
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.queue.qsize()
+        with self.lock:
+            stats["outbox_inflight"] = len(self.inflight)
+        return stats
+
+    def _worker(self):
+        session = requests.Session()
+        while True:
+            message = self.queue.get()
+            wait = self.limiter.try_acquire(message.chat_id)
+            if wait > 0:
+                self.queue.put(message, wait)
+                continue
+            try:
+                self._send(session, message)
+            except Exception as e:
+                logger.error(f"Ошибка отправки в Telegram: {e}", exc_info=True)
+                # Строка outbox останется в sending и будет забрана после аренды
+                self._release(message)
+
+    def _send(self, session, message):
+        message.attempts += 1
+        started = time.monotonic()
+        try:
+            response = session.post(f"{TELEGRAM_API}/{message.method}", json=message.payload, timeout=(3, 10))
+        except requests.RequestException as e:
+            TELEGRAM_SEND_SECONDS.labels(message.method, "network").observe(time.monotonic() - started)
+            self._retry(message, f"сеть: {e}")
+            return
+        TELEGRAM_SEND_SECONDS.labels(message.method, str(response.status_code)).observe(time.monotonic() - started)
+
+        if response.status_code == 200:
+            self._count("sent")
+            self._finish(message, "sent")
+            return
+
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+            except ValueError:
+                retry_after = 1
+            self._count("rate_limited")
+            TELEGRAM_RATE_LIMITED.inc()
+            logger.warning(f"Telegram 429 для чата {message.chat_id}, ждём {retry_after} с")
+            self.limiter.pause(retry_after)
+            message.attempts -= 1  # ограничение частоты не считается неудачной попыткой
+            self.queue.put(message, retry_after)
+            return
+
+        if response.status_code >= 500:
+            self._retry(message, f"HTTP {response.status_code}")
+            return
+
+        # 400/403: чат недоступен или сообщение некорректно — повтор не поможет
+        logger.error(f"Telegram отклонил сообщение для {message.chat_id}: "
+                     f"{response.status_code}, {response.text}")
+        self._count("failed")
+        self._finish(message, "failed", response.text)
+
+    def _retry(self, message, reason):
+        if message.attempts >= MAX_ATTEMPTS:
+            logger.error(f"Сообщение для {message.chat_id} не отправлено после "
+                         f"{message.attempts} попыток: {reason}")
+            self._count("failed")
+            self._finish(message, "failed", reason)
+            return
+        delay = min(60.0, 2 ** message.attempts) * random.uniform(0.5, 1.0)
+        logger.warning(f"Повтор отправки для {message.chat_id} через {delay:.1f} с: {reason}")
+        self._count("retried")
+        self.queue.put(message, delay)
+
+    def _release(self, message):
+        if message.outbox_id is not None:
+            with self.lock:
+                self.inflight.discard(message.outbox_id)
+
+    def _finish(self, message, status, error=None):
+        if message.outbox_id is None:
+            return
+        self._release(message)
+        try:
+            self.db.execute(
+                "UPDATE telegram_outbox SET status = %s, attempts = attempts + %s, error = %s, "
+                "sent_at = CASE WHEN %s = 'sent' THEN CURRENT_TIMESTAMP END WHERE id = %s",
+                (status, message.attempts, error, status, message.outbox_id))
+        except Exception as e:
+            logger.error(f"Ошибка обновления telegram_outbox: {e}")
+
+    def _poll_outbox(self):
+        # Забираем ожидающие сообщения, но не больше, чем помещается в
+        # OUTBOX_INFLIGHT: иначе при большой рассылке строки лежали бы в
+        # памяти дольше аренды и уходили повторно. "Зависшие" в sending дольше
+        # OUTBOX_LEASE (процесс упал во время отправки) забираются повторно;
+        # у своих ожидающих строк locked_at регулярно продлевается.
+        heartbeat = time.monotonic()
+        while True:
+            rows = []
+            try:
+                if time.monotonic() - heartbeat >= OUTBOX_HEARTBEAT:
+                    self._extend_lease()
+                    heartbeat = time.monotonic()
+                with self.lock:
+                    room = OUTBOX_INFLIGHT - len(self.inflight)
+                if room > 0:
+                    rows = self.db.execute(f"""
+                        UPDATE telegram_outbox SET status = 'sending', locked_at = CURRENT_TIMESTAMP
+                        WHERE id IN (
+                            SELECT id FROM telegram_outbox
+                            WHERE status = 'pending'
+                               OR (status = 'sending' AND locked_at < CURRENT_TIMESTAMP - INTERVAL '{OUTBOX_LEASE}')
+                            ORDER BY id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, chat_id, method, payload
+                    """, (min(room, 100),), fetch=True)
+                for outbox_id, chat_id, method, payload in rows:
+                    if isinstance(payload, str):
+                        payload = json.loads(payload)
+                    with self.lock:
+                        self.inflight.add(outbox_id)
+                    self.queue.put(Message(chat_id, payload, method, outbox_id))
+            except Exception as e:
+                logger.error(f"Ошибка чтения telegram_outbox: {e}")
+                rows = []
+            if not rows:
+                time.sleep(1.0)
+
+    def _extend_lease(self):
+        with self.lock:
+            ids = list(self.inflight)
+        if ids:
+            self.db.execute("UPDATE telegram_outbox SET locked_at = CURRENT_TIMESTAMP "
+                            "WHERE status = 'sending' AND id = ANY(%s)", (ids,))
@@ -0,0 +1,102 @@
+import logging
+import os
+from bisect import bisect_left
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+MARKET_STATS_TTL = float(os.getenv("MARKET_STATS_TTL", "60"))
+# Если в районе меньше объявлений, сравниваем со всем городом
+MARKET_STATS_MIN_LISTINGS = int(os.getenv("MARKET_STATS_MIN_LISTINGS", "20"))
+
+STATS_FIELDS = ("deal", "city", "rooms_n", "district_id", "district", "listings",
+                "price_p25", "price_median", "price_p75", "ppm2_p25", "ppm2_median", "ppm2_p75", "updated_at")
+# Процентиль n лежит в элементе массива n + 1
+STATS_COLUMNS = """
+    m.deal, m.city, m.rooms_n, m.district_id, g.name AS district, m.listings,
+    m.price_percentiles[26] AS price_p25, m.price_percentiles[51] AS price_median,
+    m.price_percentiles[76] AS price_p75,
+    m.ppm2_percentiles[26]::float8 AS ppm2_p25, m.ppm2_percentiles[51]::float8 AS ppm2_median,
+    m.ppm2_percentiles[76]::float8 AS ppm2_p75, m.updated_at
+"""
+
+
+class MarketStats:
+    # Чтение market_stats, которую пересчитывает парсер. Группа статистики —
+    # одна строка по первичному ключу; процентили групп кэшируются в памяти
+    # на MARKET_STATS_TTL, поэтому подпись к результатам поиска почти всегда
+    # обходится без запроса к БД.
+
+    def __init__(self, db, ttl=MARKET_STATS_TTL, min_listings=MARKET_STATS_MIN_LISTINGS):
+        self.db = db
+        self.min_listings = min_listings
+        self.groups = LRUCache(maxsize=4096, ttl=ttl)
+
+    def summary(self, deal, city=None, rooms=None, district=None):
+        query = (f"SELECT {STATS_COLUMNS} FROM market_stats m LEFT JOIN geo_places g ON g.id = m.district_id "
+                 "WHERE m.deal = %s")
+        params = [deal]
+        if city:
+            query += " AND m.city = %s"
+            params.append(city)
+        if rooms is not None:
+            query += " AND m.rooms_n = %s"
+            params.append(rooms)
+        if district is not None:
+            query += " AND m.district_id = %s"
+            params.append(district)
+        query += " ORDER BY m.city, m.rooms_n, m.district_id"
+        return [dict(zip(STATS_FIELDS, row)) for row in self.db.fetchall(query, params)]
+
+    def _load(self, deal, keys):
+        # {(город, комнаты, район): (объявлений, процентили цены за м²)}
+        found = {}
+        missing = []
+        for key in keys:
+            cached = self.groups.get(repr((deal,) + key))
+            if cached is None:
+                missing.append(key)
+            elif cached:
+                found[key] = cached
+        if missing:
+            rows = self.db.fetchall("""
+                SELECT city, rooms_n, district_id, listings, ppm2_percentiles FROM market_stats
+                WHERE deal = %s AND (city, rooms_n, district_id) IN %s
+            """, (deal, tuple(missing)))
+            loaded = {(city, rooms_n, district_id): (listings, [float(value) for value in percentiles or ()])
+                      for city, rooms_n, district_id, listings, percentiles in rows}
+            for key in missing:
+                # Пустая группа тоже кэшируется, чтобы не спрашивать БД повторно
+                self.groups.set(repr((deal,) + key), loaded.get(key, ()))
+            found.update(loaded)
+        return found
+
+    def percentiles(self, deal, rows):
+        # Для каждой строки выдачи — процентиль её цены за м² среди похожих
+        # (сделка, город, комнаты; район, если в нём достаточно объявлений)
+        # или None. Строки — из select_columns: price_rub, area_m2, rooms_n,
+        # city, district_id в конце.
+        keys = set()
+        for row in rows:
+            rooms_n, city, district_id = row[9], row[10], row[11]
+            if rooms_n is not None and city:
+                keys.add((city, rooms_n, 0))
+                if district_id:
+                    keys.add((city, rooms_n, district_id))
+        if not keys:
+            return [None] * len(rows)
+        groups = self._load(deal, keys)
+
+        result = []
+        for row in rows:
+            price_rub, area_m2, rooms_n, city, district_id = row[7:12]
+            group = groups.get((city, rooms_n, district_id)) if district_id else None
+            if not group or group[0] < self.min_listings:
+                group = groups.get((city, rooms_n, 0))
+            if not group or not group[1] or not price_rub or not area_m2:
+                result.append(None)
+                continue
+            ppm2 = float(price_rub) / float(area_m2)
+            result.append(min(bisect_left(group[1], ppm2), 100))
+        return result
@@ -0,0 +1,38 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+QUERY_SECONDS = Histogram(
+    "web_search_query_seconds", "Запрос поиска к БД (промахи кэша)", ["table", "shape", "sort"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 3))
+TELEGRAM_SEND_SECONDS = Histogram(
+    "web_telegram_send_seconds", "Запрос к Telegram Bot API", ["method", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+TELEGRAM_RATE_LIMITED = Counter("web_telegram_rate_limited_total", "Ответы 429 от Telegram")
+
+
+class StatsCollector:
+    # Счётчики, которые компоненты уже ведут в metrics() (пул БД, кэш,
+    # очередь Telegram), отдаются как есть, без дублирования в коде
+    def __init__(self, sources):
+        self.sources = sources
+
+    def collect(self):
+        for component, metrics in self.sources.items():
+            family = GaugeMetricFamily(f"web_{component}_stats", f"Состояние {component}", labels=["key"])
+            for key, value in metrics().items():
+                if isinstance(value, (int, float)):
+                    family.add_metric([key], value)
+            yield family
+
+
+def register_stats(**sources):
+    REGISTRY.register(StatsCollector(sources))
+
+
+def render():
+    return generate_latest(), {"Content-Type": CONTENT_TYPE_LATEST}
+
+
+def filter_shape(**filters):
+    # Набор заданных фильтров без значений: rooms+price, area, none...
+    return "+".join(name for name, value in filters.items() if value is not None and value != "") or "none"
@@ -0,0 +1,76 @@
+# Сортировка и постраничная выдача результатов поиска.
+#
+# Веб-приложение отдаёт первую страницу, следующие запрашиваются кнопкой
+# «Далее» в Telegram и обрабатываются ботом. Курсор передаётся в callback_data
+# (не больше 64 байт) в формате, который разбирает bot/search.py:
+#   pg:<сделка r|s>:<сортировка n|c|m>:<комнаты>:<площадь>:<цена>:<тип n|v>:<ключ>:<id>:<район>:<метро>
+# Район и метро — id из geo_places; кнопки без них (старый формат) тоже разбираются.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5
+
+# Telegram отклоняет всё сообщение, если callback_data кнопки длиннее 64 байт
+CALLBACK_DATA_LIMIT = 64
+
+# Сортировка -> (выражение ключа, направление)
+SORTS = {
+    "n": ("id", "DESC"),  # сначала новые
+    "c": ("price_rub", "ASC"),  # сначала дешевле
+    "m": ("ROUND(price_rub::numeric / NULLIF(area_m2, 0), 2)", "ASC"),  # по цене за м²
+}
+
+PROPERTY_TYPE_CODES = {"новостройка": "n", "вторичка": "v"}
+
+
+def select_columns(sort):
+    # Последние колонки — для процентиля цены за м² в сообщении (market.py)
+    return (f"address, price, rooms, area, link, id, {SORTS[sort][0]} AS sort_key, "
+            "price_rub, area_m2, rooms_n, city, district_id")
+
+
+def order_by(sort):
+    # Первая страница: сортировка по ключу и id плюс LIMIT на строку больше
+    # страницы, чтобы понять, есть ли продолжение. Без fetchall всей выборки.
+    key, direction = SORTS[sort]
+    if sort == "n":
+        return " ORDER BY id DESC LIMIT %s"
+    return f" AND {key} IS NOT NULL ORDER BY {key} {direction}, id {direction} LIMIT %s"
+
+
+def _fmt(value):
+    if value is None or value == "":
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+def _typed(value, convert):
+    return None if value is None or value == "" else convert(value)
+
+
+def next_page_data(deal, sort, rooms, area, price, property_type, last_row, district=None, metro=None):
+    # last_row — последняя показанная строка (..., id, sort_key).
+    # Фильтры приводятся к типам, которые разбирает бот; если курсор всё же
+    # не помещается в callback_data, кнопку «Далее» не показываем (None).
+    row_id, key = last_row[5], last_row[6]
+    data = ":".join([
+        "pg",
+        "r" if deal == "rent" else "s",
+        sort,
+        _fmt(_typed(rooms, int)),
+        _fmt(_typed(area, float)),
+        _fmt(_typed(price, int)),
+        PROPERTY_TYPE_CODES.get(property_type, ""),
+        "" if sort == "n" else _fmt(key),
+        str(int(row_id)),
+        _fmt(_typed(district, int)),
+        _fmt(_typed(metro, int)),
+    ])
+    if len(data.encode()) > CALLBACK_DATA_LIMIT:
+        logger.warning(f"Курсор не помещается в callback_data ({len(data.encode())} байт): {data}")
+        return None
+    return data